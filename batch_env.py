@@ -0,0 +1,302 @@
+import argparse, os, random, time
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import numpy as np
+from solver import neighbour_count
+# A batch of boards played together, for solvers and agents that need lots of games fast.
+# The rules are the ones of Cell.clicked(), Cell.reveal() and Grid.place_mines(), but every board lives in
+# (B, H, W) arrays and a step works on the whole batch at once. Boards that end start over right away.
+#   env = BatchEnv(1024, dims=(16, 16), mine_amount=40)
+#   observation, info = env.reset(seed=0)
+#   observation, reward, terminated, truncated, info = env.step(cells, kinds)
+# Speed test against the Game objects: python batch_env.py --batch 1024 --dims 16x16 --mines 40
+
+# What the observation shows for a cell, revealed cells show their number
+HIDDEN = -1
+FLAGGED = -2
+# Kinds of action: left click, right click and double click
+REVEAL = 0
+FLAG = 1
+CHORD = 2
+# Rewards for winning and losing, revealing cells gives the part of the safe cells that was revealed
+WIN_REWARD = 1.0
+LOSS_REWARD = -1.0
+
+
+def dilate(mask):
+    """ Grows every True cell to its 3x3 square, one row pass and one column pass """
+    grown = mask.copy()
+    grown[..., 1:, :] |= mask[..., :-1, :]
+    grown[..., :-1, :] |= mask[..., 1:, :]
+    result = grown.copy()
+    result[..., :, 1:] |= grown[..., :, :-1]
+    result[..., :, :-1] |= grown[..., :, 1:]
+    return result
+
+
+def to_bits(mask):
+    """ Packs each row of a (..., H, W) bool array with W at most 64 into one uint64, bit j is column j """
+    packed = np.packbits(mask, axis=-1, bitorder="little")
+    padded = np.zeros(mask.shape[:-1] + (8,), dtype=np.uint8)
+    padded[..., :packed.shape[-1]] = packed
+    return padded.view("<u8")[..., 0]
+
+
+def from_bits(bits, width):
+    return np.unpackbits(bits.astype("<u8")[..., None].view(np.uint8), axis=-1, count=width,
+                         bitorder="little").astype(bool)
+
+
+def dilate_bits(bits, width):
+    """ dilate() on rows packed by to_bits(), a whole row is grown with two shifts """
+    grown = bits | (bits << np.uint64(1)) | (bits >> np.uint64(1))
+    result = grown.copy()
+    result[..., 1:] |= grown[..., :-1]
+    result[..., :-1] |= grown[..., 1:]
+    return result & np.uint64(2 ** width - 1)
+
+
+# BATCH ENV OBJECT
+class BatchEnv(object):
+    """ B boards of the same size, stepped with one action per board. The observation is a read only view of
+        an int8 (B, H, W) array that is updated in place, so nothing is copied between steps """
+    def __init__(self, batch, dims=(16, 16), mine_amount=40, empty_radius=1, max_steps=None):
+        self.batch = batch
+        self.dims = dims
+        self.shape = (batch, dims[1], dims[0])
+        self.mine_amount = mine_amount
+        self.empty_radius = empty_radius
+        self.max_steps = max_steps
+        self.rng = np.random.default_rng()
+        self.mines = np.zeros(self.shape, dtype=bool)
+        self.numbers = np.zeros(self.shape, dtype=np.int8)
+        self.revealed = np.zeros(self.shape, dtype=bool)
+        self.flagged = np.zeros(self.shape, dtype=bool)
+        self.mines_placed = np.zeros(batch, dtype=bool)
+        self.safe_cells = np.zeros(batch, dtype=np.int32)
+        self.revealed_count = np.zeros(batch, dtype=np.int32)
+        self.steps = np.zeros(batch, dtype=np.int32)
+        self.board_range = np.arange(batch)
+        self.cells = np.zeros(self.shape, dtype=np.int8)
+        self.observation = self.cells.view()
+        self.observation.flags.writeable = False
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self.reset_boards(self.board_range)
+        return self.observation, {}
+
+    def reset_boards(self, boards):
+        self.mines[boards] = False
+        self.revealed[boards] = False
+        self.flagged[boards] = False
+        self.mines_placed[boards] = False
+        self.revealed_count[boards] = 0
+        self.steps[boards] = 0
+        self.cells[boards] = HIDDEN
+
+    def place_mines(self, boards, rows, cols):
+        """ Like Grid.place_mines() for many boards: every board gets the mine_amount cells with the smallest
+            random keys, and the diamond around the first click gets keys that are never picked """
+        height, width = self.shape[1:]
+        flat = np.arange(height * width)
+        distance = np.abs(flat // width - rows[:, None]) + np.abs(flat % width - cols[:, None])
+        in_diamond = distance <= self.empty_radius
+        keys = self.rng.random((len(boards), height * width))
+        keys[in_diamond] = 2.0
+        mines = np.zeros(keys.shape, dtype=bool)
+        mine_amount = min(self.mine_amount, height * width)
+        if mine_amount > 0:
+            picks = np.argpartition(keys, mine_amount - 1, axis=1)[:, :mine_amount]
+            mines[np.arange(len(boards))[:, None], picks] = True
+        mines &= ~in_diamond  # A diamond that leaves too few cells gives fewer mines, like Grid.place_mines()
+        mines = mines.reshape(len(boards), height, width)
+        self.mines[boards] = mines
+        self.numbers[boards] = np.where(mines, -1, neighbour_count(mines))
+        self.safe_cells[boards] = height * width - mines.sum(axis=(1, 2))
+        self.mines_placed[boards] = True
+
+    def show(self, boards, opened):
+        """ Marks the opened (len(boards), H, W) cells as revealed and puts their numbers in the observation """
+        self.revealed[boards] |= opened
+        self.cells[boards] = np.where(opened, self.numbers[boards], self.cells[boards])
+        self.revealed_count[boards] += opened.sum(axis=(1, 2), dtype=np.int32)
+
+    def flood(self, boards, opened):
+        """ Reveals outwards from the opened zero cells one ring at a time on all boards together. The rings are
+            grown on copies of the boards that need it, which are written back once at the end, and boards that are
+            done are dropped from the copies when they are half of them """
+        frontier = opened & (self.numbers[boards] == 0)
+        keep = frontier.any(axis=(1, 2))
+        boards, frontier = boards[keep], frontier[keep]
+        if not len(boards):
+            return
+        width = self.shape[2]
+        before = self.revealed[boards] | self.flagged[boards]
+        zero = self.numbers[boards] == 0
+        if width <= 64:
+            # Rows that fit in a uint64 are grown as bits, 8 to 64 cells in one operation
+            before, zero, frontier = to_bits(before), to_bits(zero), to_bits(frontier)
+        after = before.copy()
+        blocked = after
+        active = np.arange(len(boards))  # Which board each row of the working copies belongs to
+        while len(active):
+            # Zero cells have no mines around them, so the ring never holds a mine
+            ring = (dilate_bits(frontier, width) if width <= 64 else dilate(frontier)) & ~blocked
+            blocked |= ring
+            frontier = ring & zero
+            keep = frontier.reshape(len(active), -1).any(axis=1)
+            if keep.sum() * 2 <= len(active):
+                after[active[~keep]] = blocked[~keep]
+                active, frontier, blocked, zero = active[keep], frontier[keep], blocked[keep], zero[keep]
+        flooded = after & ~before
+        self.show(boards, from_bits(flooded, width) if width <= 64 else flooded)
+
+    def neighbours(self, boards, rows, cols):
+        """ Indices of the 3x3 squares around one cell per board, and which of them are on the board """
+        height, width = self.shape[1:]
+        around_rows = rows[:, None] + np.array([-1, -1, -1, 0, 0, 0, 1, 1, 1])
+        around_cols = cols[:, None] + np.array([-1, 0, 1, -1, 0, 1, -1, 0, 1])
+        on_board = (around_rows >= 0) & (around_rows < height) & (around_cols >= 0) & (around_cols < width)
+        return (np.repeat(boards[:, None], 9, axis=1), np.clip(around_rows, 0, height - 1),
+                np.clip(around_cols, 0, width - 1)), on_board
+
+    def step(self, cells, kinds=None):
+        """ cells holds a flat cell index (row * W + col) per board, kinds REVEAL, FLAG or CHORD per board.
+            Returns (observation, reward, terminated, truncated, info), info has the "won" and "lost" boards.
+            Boards that ended are reset before the observation is returned """
+        cells = np.asarray(cells)
+        kinds = np.zeros(self.batch, dtype=np.int8) if kinds is None else np.asarray(kinds)
+        rows, cols = np.divmod(cells, self.shape[2])
+        boards = self.board_range
+        self.steps += 1
+        reward = np.zeros(self.batch, dtype=np.float32)
+        revealed_before = self.revealed_count.copy()
+        lost = np.zeros(self.batch, dtype=bool)
+
+        # The first click of a board places its mines, whatever kind of click it is
+        first = ~self.mines_placed
+        if first.any():
+            self.place_mines(boards[first], rows[first], cols[first])
+
+        hidden = ~self.revealed[boards, rows, cols]
+        flagged = self.flagged[boards, rows, cols]
+
+        # Right clicks toggle flags on hidden cells
+        flag = (kinds == FLAG) & hidden
+        self.flagged[boards[flag], rows[flag], cols[flag]] = ~flagged[flag]
+        self.cells[boards[flag], rows[flag], cols[flag]] = np.where(flagged[flag], HIDDEN, FLAGGED)
+
+        # Left clicks and double clicks on hidden cells that are not flagged reveal them
+        reveal = (kinds != FLAG) & hidden & ~flagged
+        lost |= reveal & self.mines[boards, rows, cols]
+        reveal &= ~lost
+        if reveal.any():
+            opened = np.zeros((int(reveal.sum()),) + self.shape[1:], dtype=bool)
+            opened[np.arange(len(opened)), rows[reveal], cols[reveal]] = True
+            self.show(boards[reveal], opened)
+            self.flood(boards[reveal], opened)
+
+        # Clicking a zero that is already revealed opens around it again, a flag there may have been taken away
+        reopen = (kinds != FLAG) & ~hidden & (self.numbers[boards, rows, cols] == 0)
+        if reopen.any():
+            opened = np.zeros((int(reopen.sum()),) + self.shape[1:], dtype=bool)
+            opened[np.arange(len(opened)), rows[reopen], cols[reopen]] = True
+            self.flood(boards[reopen], opened)
+
+        # Double clicks on a number with as many flags around it reveal the rest of the cells around it
+        chord = (kinds == CHORD) & ~hidden & (self.numbers[boards, rows, cols] > 0)
+        if chord.any():
+            chord_boards = boards[chord]
+            around, on_board = self.neighbours(chord_boards, rows[chord], cols[chord])
+            flags_around = (self.flagged[around] & on_board).sum(axis=1)
+            satisfied = flags_around == self.numbers[chord_boards, rows[chord], cols[chord]]
+            chord_boards, on_board = chord_boards[satisfied], on_board[satisfied]
+            around = tuple(index[satisfied] for index in around)
+            to_open = on_board & ~self.flagged[around] & ~self.revealed[around]
+            # A wrong flag leaves a mine among the cells that are opened
+            wrong_flags = (to_open & self.mines[around]).any(axis=1)
+            lost[chord_boards[wrong_flags]] = True
+            chord_boards, to_open = chord_boards[~wrong_flags], to_open[~wrong_flags]
+            around = tuple(index[~wrong_flags] for index in around)
+            opened = np.zeros((len(chord_boards),) + self.shape[1:], dtype=bool)
+            opened[np.nonzero(to_open)[0], around[1][to_open], around[2][to_open]] = True
+            self.show(chord_boards, opened)
+            self.flood(chord_boards, opened)
+
+        # The game is won when every safe cell is revealed, see Game.won()
+        won = (self.revealed_count == self.safe_cells) & ~lost
+        reward += (self.revealed_count - revealed_before) / np.maximum(self.safe_cells, 1)
+        reward[won] += WIN_REWARD
+        reward[lost] += LOSS_REWARD
+        terminated = won | lost
+        truncated = np.zeros(self.batch, dtype=bool)
+        if self.max_steps is not None:
+            truncated = ~terminated & (self.steps >= self.max_steps)
+        info = {"won": won, "lost": lost}
+        done = terminated | truncated
+        if done.any():
+            self.reset_boards(boards[done])
+        return self.observation, reward, terminated, truncated, info
+
+
+def random_hidden_cells(env, rng):
+    """ A random hidden cell that is not flagged on every board, the policy of the speed test """
+    cells = rng.integers(0, env.shape[1] * env.shape[2], env.batch)
+    rows, cols = np.divmod(cells, env.shape[2])
+    taken = env.revealed[env.board_range, rows, cols] | env.flagged[env.board_range, rows, cols]
+    if taken.any():
+        # Draw again among the free cells of the boards where the first draw hit a taken cell
+        keys = rng.random((int(taken.sum()),) + env.shape[1:], dtype=np.float32)
+        keys[env.revealed[taken] | env.flagged[taken]] = -1.0
+        cells[taken] = keys.reshape(len(keys), -1).argmax(axis=1)
+    return cells
+
+
+def game_steps_per_second(dims, mine_amount, empty_radius, seconds):
+    """ The same random clicks on one Game at a time, the way the game itself plays """
+    from minesweeper import Game
+    rng = random.Random(0)
+    steps = 0
+    game = Game(dims, mine_amount, empty_radius)
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        if not game.is_alive:
+            game = Game(dims, mine_amount, empty_radius)
+        hidden = np.argwhere(~game.grid.revealed & ~game.grid.flagged).tolist()
+        row, col = rng.choice(hidden)
+        game.click(row, col)
+        steps += 1
+    return steps / (time.perf_counter() - start)
+
+
+def main():
+    from simulate import parse_dims
+    parser = argparse.ArgumentParser(description="Steps a batch of boards with random clicks and reports steps/sec")
+    parser.add_argument("--batch", type=int, default=1024)
+    parser.add_argument("--dims", type=parse_dims, default=(16, 16), help="Columns x rows, like 16x16")
+    parser.add_argument("--mines", type=int, default=40)
+    parser.add_argument("--radius", type=int, default=1, help="Radius of no mines from the first click")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    env = BatchEnv(args.batch, args.dims, args.mines, args.radius)
+    env.reset(seed=0)
+    rng = np.random.default_rng(0)
+    steps = 0
+    games = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.seconds:
+        observation, reward, terminated, truncated, info = env.step(random_hidden_cells(env, rng))
+        steps += args.batch
+        games += int(terminated.sum())
+    batch_rate = steps / (time.perf_counter() - start)
+    game_rate = game_steps_per_second(args.dims, args.mines, args.radius, min(args.seconds, 2.0))
+    print("Board:          %dx%d, %d mines, batch of %d" % (args.dims[0], args.dims[1], args.mines, args.batch))
+    print("Batch steps/s:  %.0f (%d games finished)" % (batch_rate, games))
+    print("Game steps/s:   %.0f with one Game object at a time" % game_rate)
+    print("Speedup:        %.1fx" % (batch_rate / game_rate))
+
+
+if __name__ == "__main__":
+    main()
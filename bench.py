@@ -0,0 +1,256 @@
+import argparse, gc, json, multiprocessing, os, queue, random, statistics, sys, tempfile, time
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+# Runs without a window or sound card, like on a build server
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+import numpy as np
+import minesweeper
+from minesweeper import Grid, GameManager, Leaderboard, GRID_DIM, MINE_COUNT, EMPTY_RADIUS, GRID_START_COORD, CELLSIZE
+from simulate import parse_dims
+# Times the hot paths of the game on boards from the default size up to 1000x1000 and compares them with a baseline.
+# Any benchmark that got slower than its threshold, and by more than BENCH_NOISE_FLOOR_MS, fails the run
+# with exit code 1.
+#   python bench.py --save      times everything and writes the baseline
+#   python bench.py             times everything and compares with the baseline
+# Thresholds are how many times slower than the baseline a benchmark may get. --threshold sets the default,
+# and the "thresholds" part of the baseline file can set one per benchmark, like {"draw_game 32x16": 2.0}.
+
+BENCH_SIZES = ["32x16", "128x128", "1000x1000"]
+BENCH_BASELINE = "bench_baseline.json"
+BENCH_THRESHOLD = 1.5
+# Every benchmark takes at most this many samples, and stops early after this many seconds, the fastest counts
+BENCH_REPEATS = 7
+BENCH_MAX_TIME = 2.0
+# A sample runs the benchmark again and again for at least this many seconds, so quick ones are not timer noise
+BENCH_SAMPLE_TIME = 0.01
+# A benchmark has to be this many ms slower as well before it counts as a regression
+BENCH_NOISE_FLOOR_MS = 0.05
+# Lines in the highscore file used for the load and save benchmarks
+BENCH_HIGHSCORE_LINES = 1000
+# Fresh processes the benchmarks run in. One process can be a lot slower than the next for the same code, so the
+# baseline keeps the median of the processes and a run is judged by its fastest one
+BENCH_PROCESSES = 3
+# Times everything is timed again when a benchmark looks too slow, before calling it a regression
+BENCH_CONFIRM_RUNS = 2
+
+
+def measure(run, setup=None, repeats=BENCH_REPEATS, max_time=BENCH_MAX_TIME):
+    """ Fastest time of one run() in ms, over samples of at least BENCH_SAMPLE_TIME each. setup() is called
+        before every run without being timed, and what it returns is given to run() """
+    samples = []
+    end = time.perf_counter() + max_time
+    # Like timeit, a garbage collection that happens to start in a run does not count against it
+    gc.collect()
+    gc.disable()
+    try:
+        while len(samples) < repeats and (not samples or time.perf_counter() < end):
+            runs, spent = 0, 0.0
+            while spent < BENCH_SAMPLE_TIME:
+                state = setup() if setup else None
+                start = time.perf_counter()
+                run(state)
+                spent += time.perf_counter() - start
+                runs += 1
+            samples.append(spent / runs * 1000)
+    finally:
+        gc.enable()
+    return min(samples)
+
+
+def mine_amount_for(dims):
+    """ The same share of mines as the default board """
+    return round(dims[0] * dims[1] * MINE_COUNT / (GRID_DIM[0] * GRID_DIM[1]))
+
+
+def open_board(dims, flag=False):
+    """ A board without mines, a click anywhere reveals all of it. A flag splits the zero region, so the flood has
+        to go cell by cell, the slowest case there is. The flag is in the last cell, so a flood that looks through
+        the region for flags again and again has to look through all of it every time """
+    grid = Grid(None, None, dims)
+    grid.place_mines(0, (0, 0), 0, seed=1)
+    if flag:
+        grid.set_cell("flagged", (dims[1] - 1, dims[0] - 1), True)
+    return grid
+
+
+def reset_reveals(grid):
+    grid.revealed[:] = False
+    grid.revealed_safe = 0
+    return grid
+
+
+def board_benchmarks(dims):
+    """ (name, ms) for the benchmarks that depend on the size of the board """
+    size = "%dx%d" % dims
+    center = (dims[1] // 2, dims[0] // 2)
+    grid = Grid(None, None, dims)
+    results = [("create_grid", measure(lambda _: grid.create_grid()))]
+    results.append(("place_mines", measure(lambda _: grid.place_mines(mine_amount_for(dims), center, EMPTY_RADIUS,
+                                                                       seed=1))))
+    results.append(("distribute_numbers", measure(lambda _: grid.distribute_numbers())))
+
+    open_grid = open_board(dims)
+    results.append(("search_and_reveal open", measure(lambda grid: grid.get_cell(*center).search_and_reveal(),
+                                                      lambda: reset_reveals(open_grid))))
+    split_grid = open_board(dims, flag=True)
+    results.append(("search_and_reveal split", measure(lambda grid: grid.get_cell(*center).search_and_reveal(),
+                                                       lambda: reset_reveals(split_grid))))
+
+    rng = random.Random(1)
+    width, height = min(dims[0], GRID_DIM[0]) * CELLSIZE, min(dims[1], GRID_DIM[1]) * CELLSIZE
+    positions = [(GRID_START_COORD[0] + rng.randrange(width), GRID_START_COORD[1] + rng.randrange(height))
+                 for _ in range(1000)]
+    results.append(("get_clicked_cell x1000", measure(lambda _: [grid.get_clicked_cell(pos) for pos in positions])))
+    return [("%s %s" % (name, size), ms) for name, ms in results]
+
+
+def draw_benchmarks():
+    """ Frames of the real window, which always shows the default board """
+    size = "%dx%d" % GRID_DIM
+    manager = GameManager()
+    manager.finish_loading()
+    manager.click(GRID_DIM[1] // 2, GRID_DIM[0] // 2)
+    dirty_rendering = minesweeper.DIRTY_RECT_RENDERING
+    try:
+        minesweeper.DIRTY_RECT_RENDERING = False
+        full = measure(lambda _: manager.draw_game(), repeats=50)
+        minesweeper.DIRTY_RECT_RENDERING = True
+        manager.draw_game()
+        hidden = np.argwhere(~manager.grid.revealed).tolist()
+
+        def flag_a_cell():
+            row, col = hidden[random.randrange(len(hidden))]
+            manager.click(row, col, leftclick=False)
+        dirty = measure(lambda _: manager.draw_game(), flag_a_cell, repeats=50)
+    finally:
+        minesweeper.DIRTY_RECT_RENDERING = dirty_rendering
+    return [("draw_game full %s" % size, full), ("draw_game dirty %s" % size, dirty)]
+
+
+def highscore_benchmarks():
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "highscores.txt")
+        with open(path, "w") as hf:
+            for _ in range(BENCH_HIGHSCORE_LINES):
+                hf.write("DEV %d %dx%d:%d\n" % (rng.randrange(999), rng.randrange(8, 40), rng.randrange(8, 40), 99))
+        leaderboard = Leaderboard(path)
+        load = measure(lambda _: leaderboard.load())
+        save = measure(lambda _: leaderboard.save())
+    return [("highscore load", load), ("highscore save", save)]
+
+
+def run_benchmarks(sizes):
+    # The small benchmarks go first, so they do not run in a heap the huge boards left behind
+    results = highscore_benchmarks()
+    results += draw_benchmarks()
+    for dims in sizes:
+        results += board_benchmarks(dims)
+    return results
+
+
+def benchmark_process(sizes, results):
+    results.put(run_benchmarks(sizes))
+
+
+def run_in_processes(sizes, processes):
+    """ Runs the benchmarks in one fresh process after another. Returns (name, [ms in each process]).
+        Not a process pool, since SDL catches the SIGTERM a pool stops its workers with """
+    timings = {}
+    context = multiprocessing.get_context("spawn")
+    for _ in range(processes):
+        results = context.Queue()
+        process = context.Process(target=benchmark_process, args=(sizes, results))
+        process.start()
+        while True:
+            try:
+                batch = results.get(timeout=1)
+                break
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError("A benchmark process stopped with exit code %s" % process.exitcode)
+        process.join()
+        for name, ms in batch:
+            timings.setdefault(name, []).append(ms)
+    return list(timings.items())
+
+
+def too_slow(name, ms, baseline, default_threshold):
+    """ True if the benchmark got slower than its threshold, and by more than the noise floor """
+    before = baseline.get("results", {}).get(name)
+    if before is None:
+        return False
+    threshold = baseline.get("thresholds", {}).get(name, default_threshold)
+    return ms / max(before, 1e-6) > threshold and ms - before > BENCH_NOISE_FLOOR_MS
+
+
+def compare(results, baseline, default_threshold):
+    """ Prints every result next to its baseline. Returns the names of the benchmarks that got too slow """
+    slow = []
+    print("%-36s %12s %12s %8s" % ("Benchmark", "Baseline ms", "Now ms", "Ratio"))
+    for name, ms in results:
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            print("%-36s %12s %12.3f %8s" % (name, "-", ms, "new"))
+            continue
+        ratio = ms / max(before, 1e-6)
+        threshold = baseline.get("thresholds", {}).get(name, default_threshold)
+        if too_slow(name, ms, baseline, default_threshold):
+            slow.append(name)
+            print("%-36s %12.3f %12.3f %7.2fx  REGRESSION (over %.2fx)" % (name, before, ms, ratio, threshold))
+        else:
+            print("%-36s %12.3f %12.3f %7.2fx" % (name, before, ms, ratio))
+    return slow
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the hot paths of the game and checks them against a baseline")
+    parser.add_argument("--sizes", type=parse_dims, nargs="+", default=[parse_dims(size) for size in BENCH_SIZES],
+                        help="Board sizes, columns x rows like 32x16")
+    parser.add_argument("--baseline", default=BENCH_BASELINE, help="Baseline file to compare with or save to")
+    parser.add_argument("--save", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="How many times slower than the baseline is a regression (default %.2f)" % BENCH_THRESHOLD)
+    parser.add_argument("--processes", type=int, default=BENCH_PROCESSES,
+                        help="Fresh processes to run the benchmarks in, the fastest counts")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+    default_threshold = args.threshold or baseline.get("threshold", BENCH_THRESHOLD)
+
+    timings = run_in_processes(args.sizes, args.processes)
+    if args.save:
+        # The baseline is what the processes usually took, a run is then compared by the fastest it managed
+        results = [(name, statistics.median(times)) for name, times in timings]
+    else:
+        results = [(name, min(times)) for name, times in timings]
+        # A benchmark that looks too slow is timed again, it is only a regression if it stays slow
+        for _ in range(BENCH_CONFIRM_RUNS):
+            if not any(too_slow(name, ms, baseline, default_threshold) for name, ms in results):
+                break
+            print("Some benchmarks look slower than their threshold, timing everything again")
+            again = dict(run_in_processes(args.sizes, args.processes))
+            results = [(name, min([ms] + again.get(name, []))) for name, ms in results]
+    slow = compare(results, baseline, default_threshold)
+
+    if args.save:
+        # Thresholds set in the file are kept, the timings are replaced
+        baseline = {"threshold": default_threshold, "thresholds": baseline.get("thresholds", {}),
+                    "results": dict(results)}
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2)
+        print("Saved the baseline to %s" % args.baseline)
+    elif not baseline:
+        print("No baseline at %s yet, run with --save to make one" % args.baseline)
+    elif slow:
+        print("FAILED: %d benchmark(s) got slower than their threshold: %s" % (len(slow), ", ".join(slow)))
+        sys.exit(1)
+    else:
+        print("OK: no benchmark got slower than its threshold")
+
+
+if __name__ == "__main__":
+    main()
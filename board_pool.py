@@ -0,0 +1,213 @@
+import argparse, multiprocessing, os, queue, random, threading
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import numpy as np
+from solver import Solver
+# No-guess boards: boards the solver can finish from the first click without ever guessing.
+# Most random boards need a guess, so finding one takes many tries. They are made on a process pool
+# and kept on disk, so a new game can take a finished board right away.
+# Fill the pool ahead of time with: python board_pool.py --dims 32x16 --mines 100 --boards 3
+
+# Folder the boards are kept in
+BOARD_POOL_FOLDER = "boards"
+# The first click picks a square of this many cells, a board is made for every square.
+# Clicking anywhere in the square opens the same empty region
+REGION_SIZE = 3
+# Boards kept ready for every square
+POOL_TARGET = 2
+# Random boards tried per task sent to a worker process
+TRIES_PER_TASK = 20
+# Tasks tried for a region before giving up, some settings never give a no-guess board
+MAX_TASKS = 500
+
+
+def region_of(first_click_idx):
+    return first_click_idx[0] // REGION_SIZE, first_click_idx[1] // REGION_SIZE
+
+
+def region_cells(shape, region):
+    rows = range(region[0] * REGION_SIZE, min((region[0] + 1) * REGION_SIZE, shape[0]))
+    cols = range(region[1] * REGION_SIZE, min((region[1] + 1) * REGION_SIZE, shape[1]))
+    return [(i, j) for i in rows for j in cols]
+
+
+def region_center(shape, region):
+    cells = region_cells(shape, region)
+    return cells[len(cells) // 2]
+
+
+def is_no_guess(game, region):
+    """ Plays the game from the middle of the region, only ever clicking cells the solver is certain of """
+    grid = game.grid
+    zero_labels = grid.zero_region_labels()
+    for idx in region_cells(grid.shape, region):
+        # The whole square has to be one empty region, so any first click in it starts the same way
+        if grid.numbers[idx] != 0 or zero_labels[idx] != zero_labels[region_center(grid.shape, region)]:
+            return False
+    solver = Solver()
+    game.click(*region_center(grid.shape, region))
+    safe_cells = grid.shape[0] * grid.shape[1] - game.mine_amount
+    while game.is_alive and int(grid.revealed.sum()) < safe_cells:
+        probabilities = solver.solve(grid.revealed, grid.flagged, grid.numbers, game.mine_amount)
+        safe = np.argwhere(probabilities == 0).tolist()
+        if not safe:
+            return False
+        for row, col in safe:
+            game.click(row, col)
+        for row, col in np.argwhere(probabilities == 1).tolist():
+            if not grid.flagged[row, col]:
+                game.click(row, col, False)
+    return game.is_alive or game.has_won
+
+
+def try_boards(args):
+    """ Worker task: tries random boards until one is no-guess. Returns the mine array or None """
+    from minesweeper import Game
+    dims, mine_amount, empty_radius, region, seed = args
+    random.seed(seed)
+    for _ in range(TRIES_PER_TASK):
+        game = Game(dims, mine_amount, empty_radius)
+        game.place_mines(region_center(game.grid.shape, region))
+        mines = game.grid.mines.copy()
+        if is_no_guess(game, region):
+            return mines
+    return None
+
+
+def worker_pool(processes=None):
+    """ A process pool for try_boards(), one is shared by all the regions of a fill() """
+    context = multiprocessing.get_context("spawn")  # The game process has a window open, so do not fork it
+    return context.Pool(processes)
+
+
+def generate(dims, mine_amount, empty_radius, region, count=1, processes=None, pool=None):
+    """ Makes count no-guess boards for a region on a process pool, fewer if MAX_TASKS runs out first.
+        Without a pool one is started for this call """
+    if pool is None:
+        with worker_pool(processes) as pool:
+            return generate(dims, mine_amount, empty_radius, region, count, processes, pool)
+    boards = []
+    first_seed = random.getrandbits(32)
+    seeds = iter(range(first_seed, first_seed + MAX_TASKS))
+    # Only a couple of tasks per process are queued, so few are left running once enough boards are found
+    most_queued = 2 * (processes or os.cpu_count() or 1)
+    results = queue.Queue()
+    queued = 0
+    while len(boards) < count:
+        while queued < most_queued:
+            seed = next(seeds, None)
+            if seed is None:
+                break
+            pool.apply_async(try_boards, ((dims, mine_amount, empty_radius, region, seed),), callback=results.put,
+                             error_callback=lambda error: results.put(None))
+            queued += 1
+        if not queued:
+            break
+        mines = results.get()
+        queued -= 1
+        if mines is not None:
+            boards.append(mines)
+    return boards
+
+
+# BOARD POOL OBJECT
+class BoardPool(object):
+    """ Keeps no-guess boards on disk, one file for every (dims, mines, radius, region).
+        Each line of a file is one board, its mine array packed into bits and written as hex """
+    def __init__(self, folder):
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.filling = False
+
+    def path(self, dims, mine_amount, empty_radius, region):
+        return os.path.join(self.folder, "%dx%d_%d_%d_%d_%d.txt" % (dims[0], dims[1], mine_amount, empty_radius,
+                                                                    region[0], region[1]))
+
+    def read(self, path):
+        if not os.path.exists(path):
+            return []
+        with open(path, "r") as pool_file:
+            return [line.strip() for line in pool_file if line.strip()]
+
+    def write(self, path, lines):
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as pool_file:
+            for line in lines:
+                pool_file.write(line + "\n")
+        os.replace(tmp_path, path)
+
+    def count(self, dims, mine_amount, empty_radius, region):
+        with self.lock:
+            return len(self.read(self.path(dims, mine_amount, empty_radius, region)))
+
+    def add(self, dims, mine_amount, empty_radius, region, mines):
+        path = self.path(dims, mine_amount, empty_radius, region)
+        with self.lock:
+            self.write(path, self.read(path) + [np.packbits(mines).tobytes().hex()])
+
+    def take(self, dims, mine_amount, empty_radius, first_click_idx):
+        """ Returns the mine array of a no-guess board for the first click, or None if the pool has none yet.
+            Boards are never made here, so the first click does not wait for them """
+        region = region_of(first_click_idx)
+        path = self.path(dims, mine_amount, empty_radius, region)
+        with self.lock:
+            lines = self.read(path)
+            if lines:
+                self.write(path, lines[1:])
+        if lines:
+            bits = np.frombuffer(bytes.fromhex(lines[0]), dtype=np.uint8)
+            return np.unpackbits(bits, count=dims[0] * dims[1]).astype(bool).reshape(dims[1], dims[0])
+        return None
+
+    def fill(self, dims, mine_amount, empty_radius, target=POOL_TARGET, first_regions=(), processes=None):
+        """ Tops every region up to target boards, starting with first_regions """
+        regions = list(first_regions)
+        for row in range((dims[1] + REGION_SIZE - 1) // REGION_SIZE):
+            for col in range((dims[0] + REGION_SIZE - 1) // REGION_SIZE):
+                if (row, col) not in regions:
+                    regions.append((row, col))
+        pool = None
+        try:
+            for region in regions:
+                missing = target - self.count(dims, mine_amount, empty_radius, region)
+                if missing > 0:
+                    # Started for the first region that needs boards and used for all of them
+                    pool = pool or worker_pool(processes)
+                    for mines in generate(dims, mine_amount, empty_radius, region, missing, processes, pool):
+                        self.add(dims, mine_amount, empty_radius, region, mines)
+        finally:
+            if pool:
+                pool.terminate()
+
+    def fill_in_background(self, dims, mine_amount, empty_radius, first_regions=()):
+        """ Runs fill() on a thread, unless it is already running """
+        if self.filling:
+            return
+
+        def run():
+            try:
+                self.fill(dims, mine_amount, empty_radius, first_regions=first_regions,
+                          processes=max(1, (os.cpu_count() or 2) - 1))
+            finally:
+                self.filling = False
+
+        self.filling = True
+        threading.Thread(target=run, daemon=True).start()
+
+
+def main():
+    from minesweeper import GRID_DIM, MINE_COUNT, EMPTY_RADIUS, resource_path
+    from simulate import parse_dims
+    parser = argparse.ArgumentParser(description="Fills the pool of no-guess boards")
+    parser.add_argument("--dims", type=parse_dims, default=GRID_DIM, help="Columns x rows, like 32x16")
+    parser.add_argument("--mines", type=int, default=MINE_COUNT)
+    parser.add_argument("--radius", type=int, default=EMPTY_RADIUS, help="Radius of no mines from the first click")
+    parser.add_argument("--boards", type=int, default=POOL_TARGET, help="Boards to keep for every region")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    BoardPool(resource_path(BOARD_POOL_FOLDER)).fill(args.dims, args.mines, args.radius, args.boards,
+                                                     processes=args.processes)
+
+
+if __name__ == "__main__":
+    main()
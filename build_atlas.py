@@ -0,0 +1,52 @@
+import json, os, pygame
+# Packs the textures the game uses every frame into one image, run this before packaging the game.
+# The highscore panel, change name buttons, background and logo are left out, they are loaded on their own
+ATLAS_DIRS = ["img/cell", "img/numbers", "img/restart_button", "img/interface"]
+LEFT_OUT = ["img/interface/background.png", "img/interface/minesweeper_logo.png",
+            "img/interface/highscore_menu.png", "img/interface/change_name_button.png",
+            "img/interface/change_name_button_clicked.png", "img/interface/change_name_button_changing.png"]
+ATLAS_IMAGE = "img/atlas.png"
+ATLAS_INDEX = "img/atlas.json"
+# Widest the atlas gets before starting a new shelf of images
+MAX_WIDTH = 512
+# Empty pixels between images
+PADDING = 1
+
+
+def pack(sizes):
+    """ Shelf packing, tallest images first. Returns the position of every image and the size of the atlas """
+    positions = {}
+    x, y, shelf_height, width = 0, 0, 0, 0
+    for name in sorted(sizes, key=lambda name: (-sizes[name][1], name)):
+        w, h = sizes[name]
+        if x + w > MAX_WIDTH and x > 0:
+            x, y = 0, y + shelf_height + PADDING
+            shelf_height = 0
+        positions[name] = (x, y)
+        x += w + PADDING
+        shelf_height = max(shelf_height, h)
+        width = max(width, x - PADDING)
+    return positions, (width, y + shelf_height)
+
+
+def main():
+    images = {}
+    for folder in ATLAS_DIRS:
+        for file_name in sorted(os.listdir(folder)):
+            path = folder + "/" + file_name
+            if file_name.endswith(".png") and path not in LEFT_OUT:
+                images[path] = pygame.image.load(path)
+    positions, size = pack({path: image.get_size() for path, image in images.items()})
+    atlas = pygame.Surface(size, pygame.SRCALPHA)
+    index = {}
+    for path, image in images.items():
+        atlas.blit(image, positions[path])
+        index[path] = list(positions[path]) + list(image.get_size())
+    pygame.image.save(atlas, ATLAS_IMAGE)
+    with open(ATLAS_INDEX, "w") as index_file:
+        json.dump(index, index_file, indent=1, sort_keys=True)
+    print("Packed %d images into %s (%dx%d)" % (len(images), ATLAS_IMAGE, size[0], size[1]))
+
+
+if __name__ == "__main__":
+    main()
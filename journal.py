@@ -0,0 +1,97 @@
+import numpy as np
+# Undo, redo and named snapshots. A click only keeps the cells it changed with their old and new values,
+# so undoing a big flood fill costs as much as the cells it opened and never copies the board.
+
+# Most changed cells kept in the journal, the oldest clicks are forgotten (and can not be undone) above this
+JOURNAL_MAX_CHANGES = 100000
+
+
+def pack_changes(changes):
+    """ Turns the (array name, idx, old, new) list the grid collects during a click into one set of numpy arrays
+        per state array. idx is a (row, col) pair or a pair of index arrays, None means a plain grid attribute.
+        Returns ({name: (rows, cols, old values, new values)}, {attribute: (old, new)}) """
+    parts = {}
+    attributes = {}
+    for name, idx, old, new in changes:
+        if idx is None:
+            attributes[name] = (attributes[name][0] if name in attributes else old, new)
+            continue
+        rows = np.atleast_1d(idx[0]).astype(np.int32)
+        cols = np.atleast_1d(idx[1]).astype(np.int32)
+        parts.setdefault(name, []).append((rows, cols, np.broadcast_to(old, rows.shape),
+                                           np.broadcast_to(new, rows.shape)))
+    cells = {}
+    for name, name_parts in parts.items():
+        cells[name] = tuple(np.concatenate([part[i] for part in name_parts]) for i in range(4))
+    return cells, attributes
+
+
+# JOURNAL ENTRY OBJECT
+class JournalEntry(object):
+    """ One undo step: the changed cells, and the game counters from before and after the click """
+    def __init__(self, changes, before, after, replay_event=None):
+        self.cells, self.attributes = pack_changes(changes)
+        self.before = before
+        self.after = after
+        self.replay_event = replay_event
+        self.size = 1 + sum(len(rows) for rows, _, _, _ in self.cells.values())
+
+
+# JOURNAL OBJECT
+class Journal(object):
+    """ The steps of a game in order. entries[:position] have been done, the rest have been undone and can be redone.
+        Snapshots are positions in the journal, counted from the first step ever added """
+    def __init__(self, max_changes=JOURNAL_MAX_CHANGES):
+        self.max_changes = max_changes
+        self.entries = []
+        self.position = 0
+        self.base = 0  # Steps forgotten by compact()
+        self.size = 0
+        self.snapshots = {}
+
+    def add(self, entry):
+        # A new step after an undo throws away the steps that could have been redone
+        for dropped in self.entries[self.position:]:
+            self.size -= dropped.size
+        del self.entries[self.position:]
+        self.snapshots = {name: spot for name, spot in self.snapshots.items() if spot <= self.base + self.position}
+        self.entries.append(entry)
+        self.position += 1
+        self.size += entry.size
+        self.compact()
+
+    def compact(self):
+        """ Forgets the oldest steps until the journal is under max_changes cells, the newest step is always kept.
+            Snapshots from before the forgotten steps go too """
+        forget = 0
+        while self.size > self.max_changes and forget < len(self.entries) - 1:
+            self.size -= self.entries[forget].size
+            forget += 1
+        if forget:
+            del self.entries[:forget]
+            self.position = max(self.position - forget, 0)
+            self.base += forget
+            self.snapshots = {name: spot for name, spot in self.snapshots.items() if spot >= self.base}
+
+    def undo(self):
+        """ Returns the step to undo, or None """
+        if self.position == 0:
+            return None
+        self.position -= 1
+        return self.entries[self.position]
+
+    def redo(self):
+        """ Returns the step to do again, or None """
+        if self.position == len(self.entries):
+            return None
+        self.position += 1
+        return self.entries[self.position - 1]
+
+    def save_snapshot(self, name):
+        self.snapshots[name] = self.base + self.position
+
+    def snapshot_position(self, name):
+        """ Where in entries a snapshot is, or None if it was never taken or has been forgotten """
+        if name not in self.snapshots:
+            return None
+        return self.snapshots[name] - self.base
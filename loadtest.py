@@ -0,0 +1,139 @@
+import argparse, asyncio, json, multiprocessing, os, random, subprocess, sys, time
+from server import SERVER_HOST, SERVER_PORT
+# Opens many sessions on server.py and plays them all with random clicks as fast as the server answers,
+# then prints how many sessions were held and the moves per second, in total and per server core.
+# Against a running server: python loadtest.py --connections 50 --sessions 20 --seconds 10
+# Or start one for the test: python loadtest.py --spawn 4
+
+
+async def play_connection(host, port, sessions, dims, mines, seconds, rng):
+    """ One connection playing its sessions in rounds: a move for every session is sent at once,
+        then all the answers are read. Returns (moves, sessions held, round trip times) """
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def send_all(messages):
+        writer.write(b"".join(json.dumps(message).encode() + b"\n" for message in messages))
+        replies = [json.loads(await reader.readline()) for _ in messages]
+        for reply in replies:
+            if not reply["ok"]:
+                raise RuntimeError(reply["error"])
+        return replies
+
+    new_game = {"op": "new", "dims": list(dims), "mines": mines}
+    replies = await send_all([new_game] * sessions)
+    session_ids = [reply["session"] for reply in replies]
+    all_cells = [(row, col) for row in range(dims[1]) for col in range(dims[0])]
+    hidden = {session_id: set(all_cells) for session_id in session_ids}
+    moves = 0
+    round_trips = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        messages = []
+        for session_id in session_ids:
+            row, col = rng.choice(all_cells)
+            while (row, col) not in hidden[session_id]:
+                row, col = rng.choice(all_cells)
+            messages.append({"op": "flag" if rng.random() < 0.1 else "click", "session": session_id,
+                             "row": row, "col": col})
+        start = time.perf_counter()
+        replies = await send_all(messages)
+        round_trips.append(time.perf_counter() - start)
+        moves += len(messages)
+        restarts = []
+        for session_id, reply in zip(session_ids, replies):
+            for row, col, char in reply["changed"]:
+                if char == "#":
+                    hidden[session_id].add((row, col))
+                else:
+                    hidden[session_id].discard((row, col))
+            if not reply["alive"] or not hidden[session_id]:
+                restarts.append(dict(new_game, session=session_id))
+                hidden[session_id] = set(all_cells)
+        if restarts:
+            await send_all(restarts)
+    writer.close()
+    return moves, len(session_ids), round_trips
+
+
+async def run_connections(args, seed):
+    rng = random.Random(seed)
+    return await asyncio.gather(*[play_connection(args.host, args.port, args.sessions, args.dims, args.mines,
+                                                  args.seconds, random.Random(rng.random()))
+                                  for _ in range(args.connections)])
+
+
+def run_client(job):
+    """ One client process, the connections are split over the processes so the client is not the bottleneck """
+    args, seed = job
+    start_cpu = time.process_time()
+    results = asyncio.run(run_connections(args, seed))
+    return results, time.process_time() - start_cpu
+
+
+async def server_info(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'{"op": "info"}\n')
+    info = json.loads(await reader.readline())
+    writer.close()
+    return info
+
+
+def wait_for_server(host, port, timeout=10.0):
+    end = time.perf_counter() + timeout
+    while True:
+        try:
+            return asyncio.run(server_info(host, port))
+        except OSError:
+            if time.perf_counter() > end:
+                raise
+            time.sleep(0.1)
+
+
+def main():
+    from simulate import parse_dims
+    parser = argparse.ArgumentParser(description="Load tests the minesweeper game server")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--connections", type=int, default=20, help="Connections per client process")
+    parser.add_argument("--sessions", type=int, default=50, help="Sessions per connection")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--dims", type=parse_dims, default=(32, 16), help="Columns x rows, like 32x16")
+    parser.add_argument("--mines", type=int, default=100)
+    parser.add_argument("--processes", type=int, default=1, help="Client processes")
+    parser.add_argument("--spawn", type=int, default=0, metavar="PROCESSES",
+                        help="Start a server with this many processes for the test")
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn:
+        server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"),
+                                   "--host", args.host, "--port", str(args.port), "--processes", str(args.spawn)])
+    try:
+        server_processes = wait_for_server(args.host, args.port)["processes"]
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.processes) as pool:
+            client_results = pool.map(run_client, [(args, seed) for seed in range(args.processes)])
+        elapsed = time.perf_counter() - start
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    results = [result for connections, _ in client_results for result in connections]
+    client_cpu = sum(cpu for _, cpu in client_results)
+    moves = sum(result[0] for result in results)
+    sessions = sum(result[1] for result in results)
+    round_trips = sorted(trip for result in results for trip in result[2])
+    print("Board:              %dx%d, %d mines" % (args.dims[0], args.dims[1], args.mines))
+    print("Sessions held:      %d on %d connections" % (sessions, len(results)))
+    print("Moves:              %d in %.2f s" % (moves, elapsed))
+    print("Moves/sec:          %.0f" % (moves / elapsed))
+    print("Moves/sec per core: %.0f (%d server process(es))" % (moves / elapsed / server_processes, server_processes))
+    if round_trips:
+        print("Round trip p50/p99: %.2f / %.2f ms for %d moves at once" % (
+            round_trips[len(round_trips) // 2] * 1000, round_trips[int(len(round_trips) * 0.99)] * 1000, args.sessions))
+    print("Client CPU:         %.0f %% of %d process(es)" % (client_cpu / elapsed / args.processes * 100, args.processes))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,14 @@
-import re, random, os, pygame, sys
+import time
+# Taken before the other imports, so the time to the first frame counts loading pygame and numpy too
+STARTUP_TIME = time.perf_counter()
+import re, random, os, pygame, sys, bisect, json, multiprocessing, threading
+import numpy as np
+from collections import deque, OrderedDict
+from solver import neighbour_count, HintEngine
+from replay import Replay, save_finished_game, REPLAY_FOLDER
+from profiler import PROFILER, profiled
+from journal import Journal, JournalEntry
+from savegame import SavedGame, write_save, SAVE_FILE
 # CONSTANTS
 # Width of play arena
 WIDTH = 1185
@@ -28,6 +38,56 @@ DOUBLE_CLICK_TIME = 200
 MINE_COUNT = 100
 # Radius of no mines from first click
 EMPTY_RADIUS = 3
+# Only redraw the cells and labels that changed since last frame
+DIRTY_RECT_RENDERING = True
+# Above this many changed cells the whole board is pushed to the display at once
+MAX_DIRTY_CELLS = 64
+# Most frames drawn per second, the game sleeps between events so this only matters while the mouse moves
+FPS_CAP = 60
+# Event posted when the time label needs to tick
+CLOCK_EVENT = pygame.USEREVENT + 1
+# Texture atlas made by build_atlas.py
+ATLAS_IMAGE = "img/atlas.png"
+ATLAS_INDEX = "img/atlas.json"
+# Font shipped with the game, the system monospace font is used if it is missing
+FONT_FILE = "fonts/DejaVuSansMono-Bold.ttf"
+# How many rendered text labels are kept around
+TEXT_CACHE_SIZE = 64
+# Only give boards that can be solved without guessing, see board_pool.py
+NO_GUESS = False
+# Event posted by the hint engine when it has solved the board
+HINT_EVENT = pygame.USEREVENT + 2
+# Keys for showing certain safe cells and mines, and for showing the chance of a mine on every hidden cell
+HINT_KEY = pygame.K_h
+HEATMAP_KEY = pygame.K_p
+# Key that shows the frame profiler when it is turned on, and where it is drawn
+PROFILER_KEY = pygame.K_F3
+PROFILER_OVERLAY_RECT = pygame.Rect(GRID_START_COORD, (440, 200))
+# Ctrl and these keys undo and redo clicks, the others save and load a quick snapshot of the game
+UNDO_KEY = pygame.K_z
+REDO_KEY = pygame.K_y
+SNAPSHOT_SAVE_KEY = pygame.K_F5
+SNAPSHOT_LOAD_KEY = pygame.K_F9
+# Infinite mode, the board has no edges and is made in square chunks as the player scrolls to them
+INFINITE_MODE = False
+CHUNK_SIZE = 16
+# Chance of a mine on a cell of the infinite board
+MINE_DENSITY = 0.18
+# Most chunks kept in memory, chunks the player has changed are packed into bits when they are thrown out
+CHUNK_CACHE_SIZE = 256
+# Keys that scroll the infinite board one cell, the middle mouse button drags it and the wheel scrolls it too
+SCROLL_KEYS = {pygame.K_LEFT: (-1, 0), pygame.K_RIGHT: (1, 0), pygame.K_UP: (0, -1), pygame.K_DOWN: (0, 1)}
+# Event posted when the textures and fonts loaded in the background are ready
+ASSETS_EVENT = pygame.USEREVENT + 3
+# Drawn behind the board until the background texture is loaded
+LOADING_COLOR = (0, 180, 251)
+# Most milliseconds from start to the first frame before --startup-time fails
+STARTUP_TARGET_MS = 1000
+# Ctrl and these keys save the game in progress to SAVE_FILE and load it again, see savegame.py
+SAVE_KEY = pygame.K_s
+RESUME_KEY = pygame.K_l
+# Saved boards with more cells than this are not unpacked when resumed, they are read from the file as they are seen
+SAVE_IN_MEMORY_CELLS = 1 << 22
 # Misc
 PLAYER_NAME = "DEV"
 
@@ -42,42 +102,82 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 
+def cell_looks_of(revealed, flagged, mines, numbers, highlight, held_idx=None, overlay=None):
+    """ Gives every cell a small code for what it looks like, so two frames can be compared in one go.
+        0 hidden, 1 held, 2 flagged, 3 revealed, 4-11 numbers, 12 mine, 13 red mine, 14 green mine """
+    looks = np.where(flagged, 2, 0).astype(np.uint16)
+    if held_idx is not None and not flagged[held_idx]:
+        looks[held_idx] = 1
+    if overlay is not None:
+        # Hint overlays on hidden cells add 16 times (tenths + 1) to the code
+        shown = ~flagged & (overlay != 255)
+        looks += np.where(shown, (overlay.astype(np.uint16) + 1) * 16, 0).astype(np.uint16)
+    revealed_looks = np.where(mines, 12 + highlight.astype(np.uint16), 3 + np.maximum(numbers, 0))
+    return np.where(revealed, revealed_looks, looks).astype(np.uint16)
+
+
 # CELL OBJECT
 class Cell(pygame.Rect):
-    def __init__(self, left, top, width, height, textures, idx, grid):
-        pygame.Rect.__init__(self, left, top, width, height)
-        self.hidden_tex = textures[0]
-        self.revealed_tex = textures[1]
-        self.mine_tex = textures[2]
-        self.mine_red_tex = textures[3]
-        self.mine_green_tex = textures[4]
-        self.flag_tex = textures[5]
-        self.number_tex = None
+    """ A cell is only a view into the arrays kept by the grid, so it can be created and thrown away at will """
+    def __init__(self, grid, idx):
+        pygame.Rect.__init__(self, grid.start_coord[0] + idx[1] * CELLSIZE, grid.start_coord[1] + idx[0] * CELLSIZE,
+                             CELLSIZE, CELLSIZE)
         self.idx = idx
         self.grid = grid
-        self.is_revealed = False
-        self.is_mine = False
-        self.flagged = False
-        self.number = -1
-        self.held = False
-        self.highlight = 0
 
         self.exploded_mine = (-1, -1)
 
-    def place_mine(self):
-        self.is_mine = True
+    @property
+    def is_mine(self):
+        return bool(self.grid.mines[self.idx])
+
+    @property
+    def is_revealed(self):
+        return bool(self.grid.revealed[self.idx])
+
+    @is_revealed.setter
+    def is_revealed(self, value):
+        self.grid.set_cell("revealed", self.idx, value)
+
+    @property
+    def flagged(self):
+        return bool(self.grid.flagged[self.idx])
+
+    @flagged.setter
+    def flagged(self, value):
+        self.grid.set_cell("flagged", self.idx, value)
 
-    def set_num(self, number, number_tex):
-        self.number = number
-        if number > 0:
-            self.number_tex = number_tex
+    @property
+    def number(self):
+        return int(self.grid.numbers[self.idx])
+
+    @property
+    def highlight(self):
+        return int(self.grid.highlight[self.idx])
+
+    @highlight.setter
+    def highlight(self, value):
+        self.grid.set_cell("highlight", self.idx, value)
+
+    @property
+    def held(self):
+        return self.grid.held_idx == self.idx
+
+    @held.setter
+    def held(self, value):
+        if value:
+            self.grid.held_idx = self.idx
+        elif self.grid.held_idx == self.idx:
+            self.grid.held_idx = None
+
+    def place_mine(self):
+        self.grid.mines[self.idx] = True
 
     def clicked(self, leftclick, double_click):
         if leftclick:  # left click
             if self.is_revealed and self.number > 0 and double_click:
-                succesful_flag_count, self.exploded_mine = self.grid.get_cell_minecount(self.idx[0], self.idx[1],
-                                                                                        flags_override=True)
-                if succesful_flag_count == self.number:
+                if self.grid.flag_count(self.idx[0], self.idx[1]) == self.number:
+                    _, self.exploded_mine = self.grid.get_cell_minecount(self.idx[0], self.idx[1], flags_override=True)
                     if self.exploded_mine:
                         return -3  # Exit code 3 means player double clicked a cell with wrong flags around it (and is now dead)
                     self.search_and_reveal()
@@ -117,256 +217,1405 @@ class Cell(pygame.Rect):
             return 2  # Exitcode 2 means search_and_reveal() should append the cell to it's search queue
         return 0  # See above
 
+    @profiled("search_and_reveal")
     def search_and_reveal(self):
-        queue = [self.idx]
-        seen = [self.idx]
-        while len(queue) > 0:
-            for i in range(queue[0][0] - 1, queue[0][0] + 2):
-                for j in range(queue[0][1] - 1, queue[0][1] + 2):
-                    if not (i < 0 or i > GRID_DIM[1] - 1 or j < 0 or j > GRID_DIM[0] - 1) \
-                            and (i, j) not in seen and not self.grid.cells[i][j].is_revealed:
-                        seen.append((i, j))
-                        exit_code = self.grid.cells[i][j].reveal(False)
-                        if exit_code == 2:
-                            queue.append((i, j))
-            queue = queue[1:]
+        self.grid.flood_reveal(self.idx)
 
     def draw(self, screen):
-        if self.is_revealed:
-            screen.blit(self.revealed_tex, self.topleft)
-            if self.is_mine:
-                if self.highlight == 1:
-                    screen.blit(self.mine_red_tex, self.topleft)
-                elif self.highlight == 2:
-                    screen.blit(self.mine_green_tex, self.topleft)
-                else:
-                    screen.blit(self.mine_tex, self.topleft)
-            elif self.number > 0:
-                screen.blit(self.number_tex, self.topleft)
-        else:
-            if self.flagged:
-                screen.blit(self.hidden_tex, self.topleft)
-                screen.blit(self.flag_tex, self.topleft)
-            elif self.held:
-                screen.blit(self.revealed_tex, self.topleft)
-            else:
-                screen.blit(self.hidden_tex, self.topleft)
+        self.grid.draw_cell(screen, self.idx[0], self.idx[1])
 
 
 # GRID OBJECT
 class Grid(object):
-    def __init__(self, cell_textures, number_tex_list):
-        self.cells = []
+    """ Holds the board state as numpy arrays of shape (rows, cols), one byte per cell for each array.
+        With saved, the board is taken from a save file instead of being made empty """
+    def __init__(self, cell_textures, number_tex_list, dims=GRID_DIM, start_coord=GRID_START_COORD, saved=None):
         self.cell_textures = cell_textures
         self.number_tex_list = number_tex_list
-        self.create_grid()
-
-    def create_grid(self):
-        self.cells = []
-        pos = GRID_START_COORD
-        for i in range(GRID_DIM[1]):
-            row = []
-            for j in range(GRID_DIM[0]):
-                new_cell = Cell(pos[0], pos[1], CELLSIZE, CELLSIZE, self.cell_textures, (i, j), self)
-                row.append(new_cell)
-                pos = (pos[0] + CELLSIZE, pos[1])
-            self.cells.append(row)
-            pos = (GRID_START_COORD[0], pos[1] + CELLSIZE)
-
-    def place_mines(self, mine_amount, first_click_idx, empty_radius):
+        self.dims = dims
+        self.shape = (dims[1], dims[0])
+        self.start_coord = start_coord
+        self.create_grid(saved)
+
+    def create_grid(self, saved=None):
+        if saved is None:
+            self.mines = np.zeros(self.shape, dtype=bool)
+            self.revealed = np.zeros(self.shape, dtype=bool)
+            self.flagged = np.zeros(self.shape, dtype=bool)
+            self.numbers = np.full(self.shape, -1, dtype=np.int8)
+        else:
+            # The numbers were saved with the board, so nothing has to be counted again
+            self.mines = saved.array("mines")
+            self.revealed = saved.array("revealed")
+            self.flagged = saved.array("flagged")
+            self.numbers = saved.array("numbers")
+        self.board_shape = self.shape
+        self.highlight = np.zeros(self.shape, dtype=np.uint8)
+        self.held_idx = None
+        # While a click is journaled, every change to the state arrays is added here as (name, idx, old, new)
+        self.changes = None
+        # Counters kept up to date as cells change, so a chord or the win check never looks around the board
+        self.mine_cells = np.nonzero(self.mines)
+        self.zero_labels = None  # Found by the first flood_reveal()
+        if saved is None:
+            self.seed = None
+            self.flag_counts = np.zeros(self.shape, dtype=np.int8)  # Flags in the 3x3 square around each cell
+            self.revealed_safe = 0
+            self.safe_cells = self.mines.size
+        else:
+            self.seed = saved.seed
+            self.flag_counts = self.neighbour_count(self.flagged).astype(np.int8)
+            self.revealed_safe = saved.revealed_safe
+            self.safe_cells = saved.safe_cells
+        self.surface = None
+        self.drawn_looks = None
+        # Hint overlay, the chance of a mine in tenths for each cell or 255 for no overlay
+        self.overlay = None
+        self.overlay_textures = None
+
+    def get_cell(self, row, col):
+        return Cell(self, (row, col))
+
+    def set_cell(self, name, idx, value):
+        array = getattr(self, name)
+        old = array[idx]
+        if self.changes is not None:
+            self.changes.append((name, idx, old, value))
+        array[idx] = value
+        if bool(old) != bool(value):
+            self.count_change(name, idx[0], idx[1], 1 if value else -1)
+
+    def set_cells(self, array, rows, cols, values):
+        array[rows, cols] = values
+
+    def band(self, name, top, bottom):
+        """ Rows top to bottom of one state array, for saving the game """
+        return getattr(self, name)[top:bottom]
+
+    def count_change(self, name, rows, cols, delta):
+        """ Updates the counters for cells that were flagged or revealed (delta 1) or unflagged or hidden again
+            (delta -1). rows, cols and delta are numbers for one cell, or arrays after an undo or redo """
+        if not isinstance(rows, np.ndarray):
+            if name == "flagged":
+                self.flag_counts[max(rows - 1, 0):rows + 2, max(cols - 1, 0):cols + 2] += delta
+            elif name == "revealed" and not self.mines[rows, cols]:
+                self.revealed_safe += delta
+        elif name == "flagged":
+            for i in (-1, 0, 1):
+                for j in (-1, 0, 1):
+                    around_rows, around_cols = rows + i, cols + j
+                    on_board = ((around_rows >= 0) & (around_rows < self.shape[0]) &
+                                (around_cols >= 0) & (around_cols < self.shape[1]))
+                    np.add.at(self.flag_counts, (around_rows[on_board], around_cols[on_board]), delta[on_board])
+        elif name == "revealed":
+            self.revealed_safe += int(delta[~self.mines[rows, cols]].sum())
+
+    def flag_count(self, row, col):
+        return int(self.flag_counts[row, col])
+
+    def apply_changes(self, entry, undo):
+        """ Puts back the old values of a journal entry, or the new values again for a redo """
+        for name, (rows, cols, old, new) in entry.cells.items():
+            array = getattr(self, name)
+            if undo:
+                # Backwards, so a cell changed twice in one click gets its first value back
+                self.set_cells(array, rows[::-1], cols[::-1], old[::-1])
+            else:
+                self.set_cells(array, rows, cols, new)
+            if name in ("flagged", "revealed"):
+                delta = new.astype(np.int8) - old.astype(np.int8)
+                self.count_change(name, rows, cols, -delta if undo else delta)
+        for name, (old, new) in entry.attributes.items():
+            setattr(self, name, old if undo else new)
+
+    @profiled("place_mines")
+    def place_mines(self, mine_amount, first_click_idx, empty_radius, seed=None):
         """ Place mines is called after first click so the player never clicks a mine on first click.
-            There is also some radius of empty cells from the players first click """
-        remaining_positions = []
-        for i in range(GRID_DIM[1]):
-            for j in range(GRID_DIM[0]):
-                dist_from_click = max(first_click_idx[0], i) - min(first_click_idx[0], i) \
-                                  + max(first_click_idx[1], j) - min(first_click_idx[1], j)
-                if dist_from_click > empty_radius:
-                    remaining_positions.append((i, j))
-        if mine_amount >= len(remaining_positions):
-            mine_amount = remaining_positions
-        while mine_amount > 0:
-            rand_idx = random.randint(0, len(remaining_positions) - 1)
-            rand_pos = remaining_positions[rand_idx]
-            del remaining_positions[rand_idx]
-            self.cells[rand_pos[0]][rand_pos[1]].place_mine()
-            mine_amount -= 1
+            There is also some radius of empty cells from the players first click.
+            The same seed and first click always give the same board, the seed used is kept in self.seed """
+        if seed is None:
+            seed = random.getrandbits(63)
+        self.seed = seed
+        rows, cols = self.shape
+        # Flat indices of the empty diamond around the first click, in increasing order
+        # No two cells of the board are further apart than rows + cols - 2, so a bigger radius leaves out the same cells
+        radius = max(min(empty_radius, rows + cols - 2), 0)
+        diamond_rows, diamond_cols = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        in_diamond = np.abs(diamond_rows) + np.abs(diamond_cols) <= empty_radius
+        diamond_rows = diamond_rows[in_diamond] + first_click_idx[0]
+        diamond_cols = diamond_cols[in_diamond] + first_click_idx[1]
+        on_board = (diamond_rows >= 0) & (diamond_rows < rows) & (diamond_cols >= 0) & (diamond_cols < cols)
+        excluded = np.sort(diamond_rows[on_board] * cols + diamond_cols[on_board])
+
+        # Pick among the cells that are left as if the diamond was cut out, then step over the diamond
+        free_cells = rows * cols - len(excluded)
+        mine_amount = max(0, min(mine_amount, free_cells))
+        picks = np.random.default_rng(seed).choice(free_cells, size=mine_amount, replace=False)
+        picks += np.searchsorted(excluded - np.arange(len(excluded)), picks, side="right")
+        self.mines = np.zeros(self.shape, dtype=bool)
+        self.mines.reshape(-1)[picks] = True
 
         self.distribute_numbers()
 
+    @profiled("distribute_numbers")
     def distribute_numbers(self):
-        for i in range(GRID_DIM[1]):
-            for j in range(GRID_DIM[0]):
-                if self.cells[i][j].is_mine:
-                    continue
-                num, cell = self.get_cell_minecount(i, j)
-                self.cells[i][j].set_num(num, self.number_tex_list[num - 1])
+        self.numbers = np.where(self.mines, -1, self.neighbour_count(self.mines)).astype(np.int8)
+        self.mine_cells = np.nonzero(self.mines)
+        self.safe_cells = self.mines.size - len(self.mine_cells[0])
+        self.zero_labels = None
+
+    def neighbour_count(self, array):
+        return neighbour_count(array)
+
+    def find_zero_regions(self):
+        """ Labels the 8-connected regions of zero cells so a click on one can open the whole region at once.
+            Each row is split into runs of zeros, and runs that touch in neighbouring rows are merged.
+            Called by the first flood_reveal() after the numbers change, so boards that are never clicked skip it """
+        rows, cols = self.shape
+        zero = np.zeros((rows, cols + 2), dtype=np.int8)
+        zero[:, 1:-1] = self.numbers == 0
+        edges = np.diff(zero, axis=1)
+        run_rows, run_starts = np.nonzero(edges == 1)
+        run_stops = np.nonzero(edges == -1)[1]
+
+        # The runs of the next row that touch a run are next to each other, found by searching the runs by position
+        width = cols + 2
+        start_keys = run_rows * width + run_starts
+        stop_keys = run_rows * width + run_stops
+        first = np.searchsorted(stop_keys, (run_rows + 1) * width + run_starts, side="left")
+        last = np.searchsorted(start_keys, (run_rows + 1) * width + run_stops, side="right")
+        touching = np.maximum(last - first, 0)
+        above = np.repeat(np.arange(len(run_rows)), touching)
+        below = np.repeat(first - np.cumsum(touching) + touching, touching) + np.arange(len(above))
+
+        # Every run points at the smallest run it is known to be connected to, until nothing changes
+        parent = np.arange(len(run_rows))
+        while True:
+            smallest = np.minimum(parent[above], parent[below])
+            merged = parent.copy()
+            np.minimum.at(merged, parent[above], smallest)
+            np.minimum.at(merged, parent[below], smallest)
+            while True:
+                jumped = merged[merged]
+                if np.array_equal(jumped, merged):
+                    break
+                merged = jumped
+            if np.array_equal(merged, parent):
+                break
+            parent = merged
+
+        roots, run_labels = np.unique(parent, return_inverse=True)
+        self.zero_runs = (run_rows, run_starts, run_stops)
+        # The runs of each region, region label holds zero_region_runs[zero_region_starts[label]:...[label + 1]]
+        self.zero_region_runs = np.argsort(run_labels, kind="stable")
+        self.zero_region_starts = np.searchsorted(run_labels[self.zero_region_runs], np.arange(len(roots) + 1))
+        lengths = run_stops - run_starts
+        before = np.cumsum(lengths) - lengths
+        cells = np.repeat(run_rows * cols + run_starts - before, lengths) + np.arange(lengths.sum())
+        self.zero_labels = np.full(self.shape, -1, dtype=np.int32)
+        self.zero_labels.reshape(-1)[cells] = np.repeat(run_labels, lengths)
+
+    def zero_region_labels(self):
+        """ The label of the zero region of every cell, -1 for cells that are not zero """
+        if self.zero_labels is None:
+            self.find_zero_regions()
+        return self.zero_labels
+
+    def on_board(self, row, col):
+        return 0 <= row < self.shape[0] and 0 <= col < self.shape[1]
 
     def get_cell_minecount(self, row, col, flags_override=False):
         count = 0
         mine_exploded = None
         for i in range(row - 1, row + 2):
             for j in range(col - 1, col + 2):
-                if i < 0 or i > GRID_DIM[1] - 1 or j < 0 or j > GRID_DIM[0] - 1:
+                if not self.on_board(i, j):
                     continue
-                cell = self.cells[i][j]
                 if flags_override:
-                    if cell.flagged:
+                    if self.flagged[i, j]:
                         count += 1
-                    elif cell.is_mine and not cell.flagged:
-                        mine_exploded = cell
+                    elif self.mines[i, j]:
+                        mine_exploded = self.get_cell(i, j)
                 else:
-                    if cell.is_mine:
+                    if self.mines[i, j]:
                         count += 1
         return count, mine_exploded
 
+    def flood_reveal(self, start_idx):
+        """ Reveals outwards from start_idx like the player expects. Every cell is queued at most once,
+            and zero regions without flags in them are opened in one go from the runs found by find_zero_regions() """
+        rows, cols = self.shape
+        changes = self.changes
+        zero_labels = self.zero_region_labels()
+        # Regions a flag splits, so each region is only looked through once
+        split = set()
+        queue = deque([start_idx])
+        while queue:
+            row, col = queue.popleft()
+            for i in range(max(row - 1, 0), min(row + 2, rows)):
+                for j in range(max(col - 1, 0), min(col + 2, cols)):
+                    if self.revealed[i, j] or self.flagged[i, j] or self.mines[i, j]:
+                        continue
+                    if self.numbers[i, j] == 0:
+                        label = zero_labels[i, j]
+                        if label not in split:
+                            if self.open_zero_region(label):
+                                continue
+                            split.add(label)
+                        queue.append((i, j))
+                    self.revealed[i, j] = True
+                    self.revealed_safe += 1
+                    if changes is not None:
+                        changes.append(("revealed", (i, j), False, True))
+
+    def open_zero_region(self, label):
+        """ Reveals a whole zero region and its numbered border. Returns False if a flag splits the region,
+            since then the cell by cell search has to decide what gets revealed """
+        run_idx = self.zero_region_runs[self.zero_region_starts[label]:self.zero_region_starts[label + 1]]
+        runs = list(zip(*(run_part[run_idx].tolist() for run_part in self.zero_runs)))
+        for row, start, stop in runs:
+            if self.flagged[row, start:stop].any():
+                return False
+        rows, cols = self.shape
+        for row, start, stop in runs:
+            top, bottom = max(row - 1, 0), min(row + 2, rows)
+            left, right = max(start - 1, 0), min(stop + 1, cols)
+            opened = ~self.revealed[top:bottom, left:right] & ~self.flagged[top:bottom, left:right]
+            if self.changes is not None:
+                opened_rows, opened_cols = np.nonzero(opened)
+                self.changes.append(("revealed", (opened_rows + top, opened_cols + left), False, True))
+            self.revealed[top:bottom, left:right] |= opened
+            self.revealed_safe += int(opened.sum())  # The border of a zero region has no mines
+        return True
+
     def reveal_all_mines(self):
-        for i in range(GRID_DIM[1]):
-            for j in range(GRID_DIM[0]):
-                if self.cells[i][j].is_mine:
-                    self.cells[i][j].reveal(True, True)
+        """ Only looks at the mine cells, not the whole board """
+        rows, cols = self.mine_cells
+        hidden = ~self.revealed[rows, cols]
+        if self.changes is not None:
+            self.changes.append(("revealed", (rows[hidden], cols[hidden]), False, True))
+        self.revealed[rows, cols] = True
 
     def reveal_all(self):
-        for i in range(GRID_DIM[1]):
-            for j in range(GRID_DIM[0]):
-                self.cells[i][j].reveal(True, True)
-                if self.cells[i][j].is_mine:
-                    self.cells[i][j].highlight = 2  # Set to green highlight
-
-    def get_clicked_cell(self, click_pos):
-        for i in range(GRID_DIM[1]):
-            for j in range(GRID_DIM[0]):
-                if self.cells[i][j].collidepoint(click_pos):
-                    return self.cells[i][j]
-        return None
+        """ A game is won when every safe cell is revealed, so only the mines are left to show """
+        self.reveal_all_mines()
+        rows, cols = self.mine_cells
+        if self.changes is not None:
+            self.changes.append(("highlight", (rows, cols), self.highlight[rows, cols], 2))
+        self.highlight[rows, cols] = 2  # Set to green highlight
+
+    @profiled("get_clicked_cell")
+    def get_cell_idx(self, pos, scroll=(0, 0), zoom=1.0):
+        """ Turns a screen position into a (row, col) index with plain arithmetic, or None if it is off the board.
+            scroll is how many pixels the board has been moved, zoom scales the size of a cell """
+        cell_size = CELLSIZE * zoom
+        col = int((pos[0] - self.start_coord[0] + scroll[0]) // cell_size)
+        row = int((pos[1] - self.start_coord[1] + scroll[1]) // cell_size)
+        if row < 0 or row > self.shape[0] - 1 or col < 0 or col > self.shape[1] - 1:
+            return None
+        return row, col
+
+    def get_clicked_cell(self, click_pos, scroll=(0, 0), zoom=1.0):
+        idx = self.get_cell_idx(click_pos, scroll, zoom)
+        if idx is None:
+            return None
+        return self.get_cell(idx[0], idx[1])
 
+    def draw_cell(self, screen, row, col, origin=None):
+        if origin is None:
+            origin = self.start_coord
+        pos = (origin[0] + col * CELLSIZE, origin[1] + row * CELLSIZE)
+        hidden_tex, revealed_tex, mine_tex, mine_red_tex, mine_green_tex, flag_tex = self.cell_textures
+        if self.revealed[row, col]:
+            screen.blit(revealed_tex, pos)
+            if self.mines[row, col]:
+                if self.highlight[row, col] == 1:
+                    screen.blit(mine_red_tex, pos)
+                elif self.highlight[row, col] == 2:
+                    screen.blit(mine_green_tex, pos)
+                else:
+                    screen.blit(mine_tex, pos)
+            elif self.numbers[row, col] > 0:
+                screen.blit(self.number_tex_list[self.numbers[row, col] - 1], pos)
+        else:
+            if self.flagged[row, col]:
+                screen.blit(hidden_tex, pos)
+                screen.blit(flag_tex, pos)
+            elif self.held_idx == (row, col):
+                screen.blit(revealed_tex, pos)
+            else:
+                screen.blit(hidden_tex, pos)
+            if self.overlay is not None and not self.flagged[row, col] and self.overlay[row, col] != 255:
+                screen.blit(self.get_overlay_texture(self.overlay[row, col]), pos)
+
+    @profiled("Grid.draw")
     def draw(self, screen):
-        for i in range(GRID_DIM[1]):
-            for j in range(GRID_DIM[0]):
-                self.cells[i][j].draw(screen)
+        for i in range(self.shape[0]):
+            for j in range(self.shape[1]):
+                self.draw_cell(screen, i, j)
+
+    def cell_looks(self):
+        return cell_looks_of(self.revealed, self.flagged, self.mines, self.numbers, self.highlight, self.held_idx,
+                             self.overlay)
+
+    def get_overlay_texture(self, tenths):
+        """ See-through squares going from green for safe to red for a mine """
+        if self.overlay_textures is None:
+            self.overlay_textures = []
+            for i in range(11):
+                texture = pygame.Surface((CELLSIZE, CELLSIZE), pygame.SRCALPHA)
+                texture.fill((int(220 * i / 10), int(200 * (10 - i) / 10), 0, 110))
+                self.overlay_textures.append(texture)
+        return self.overlay_textures[tenths]
+
+    @profiled("Grid.update_surface")
+    def update_surface(self):
+        """ Redraws the cells that look different since last call onto the cached board surface.
+            Returns the screen rects that changed """
+        if self.surface is None:
+            self.surface = pygame.Surface((self.dims[0] * CELLSIZE, self.dims[1] * CELLSIZE))
+        looks = self.cell_looks()
+        if self.drawn_looks is None:
+            changed = np.argwhere(np.ones(self.shape, dtype=bool))
+        else:
+            changed = np.argwhere(looks != self.drawn_looks)
+        self.drawn_looks = looks
+        for row, col in changed.tolist():
+            self.draw_cell(self.surface, row, col, (0, 0))
+        if len(changed) > MAX_DIRTY_CELLS:
+            return [self.surface.get_rect(topleft=self.start_coord)]
+        return [pygame.Rect(self.start_coord[0] + col * CELLSIZE, self.start_coord[1] + row * CELLSIZE, CELLSIZE, CELLSIZE)
+                for row, col in changed.tolist()]
+
+    def blit_surface(self, screen, rects=None):
+        if rects is None:
+            screen.blit(self.surface, self.start_coord)
+            return
+        for rect in rects:
+            screen.blit(self.surface, rect.topleft, rect.move(-self.start_coord[0], -self.start_coord[1]))
+
+
+# CHUNK OBJECT
+class Chunk(object):
+    """ One CHUNK_SIZE x CHUNK_SIZE square of the infinite board, with the same arrays as Grid.
+        touched is set once the player has changed anything in it """
+    def __init__(self, mines, numbers):
+        self.mines = mines
+        self.numbers = numbers
+        self.revealed = np.zeros(mines.shape, dtype=bool)
+        self.flagged = np.zeros(mines.shape, dtype=bool)
+        self.highlight = np.zeros(mines.shape, dtype=np.uint8)
+        self.touched = False
+
+    def pack(self):
+        """ What the player did in the chunk, the mines do not need to be kept since they come from the seed """
+        highlight = self.highlight.copy() if self.highlight.any() else None
+        return np.packbits(self.revealed).tobytes(), np.packbits(self.flagged).tobytes(), highlight
+
+    def unpack(self, packed):
+        revealed, flagged, highlight = packed
+        cell_count = self.mines.size
+        self.revealed = np.unpackbits(np.frombuffer(revealed, dtype=np.uint8), count=cell_count).astype(bool).reshape(
+            self.mines.shape)
+        self.flagged = np.unpackbits(np.frombuffer(flagged, dtype=np.uint8), count=cell_count).astype(bool).reshape(
+            self.mines.shape)
+        if highlight is not None:
+            self.highlight = highlight
+        self.touched = True
+
+
+class ChunkArray(object):
+    """ Lets the infinite grid be indexed with [row, col] like the arrays of Grid, so Cell works on it unchanged """
+    def __init__(self, grid, name):
+        self.grid = grid
+        self.name = name
+
+    def __getitem__(self, idx):
+        chunk = self.grid.get_chunk(idx[0] // CHUNK_SIZE, idx[1] // CHUNK_SIZE)
+        return getattr(chunk, self.name)[idx[0] % CHUNK_SIZE, idx[1] % CHUNK_SIZE]
+
+    def __setitem__(self, idx, value):
+        chunk = self.grid.get_chunk(idx[0] // CHUNK_SIZE, idx[1] // CHUNK_SIZE)
+        getattr(chunk, self.name)[idx[0] % CHUNK_SIZE, idx[1] % CHUNK_SIZE] = value
+        chunk.touched = True
+
+
+def zigzag(number):
+    """ 0, -1, 1, -2, 2 ... to 0, 1, 2, 3, 4 ..., seeds can not be negative """
+    return number * 2 if number >= 0 else -number * 2 - 1
+
+
+# INFINITE GRID OBJECT
+class InfiniteGrid(Grid):
+    """ A board without edges. dims is the size of the view in cells and scroll is where the view is in pixels.
+        The mines of a chunk come from a hash of the seed and the chunk position, so a chunk that is made again,
+        or next to another one, always fits. Chunks used longest ago are thrown out above CHUNK_CACHE_SIZE """
+    def create_grid(self, saved=None):
+        Grid.create_grid(self)
+        self.mines = ChunkArray(self, "mines")
+        self.revealed = ChunkArray(self, "revealed")
+        self.flagged = ChunkArray(self, "flagged")
+        self.numbers = ChunkArray(self, "numbers")
+        self.highlight = ChunkArray(self, "highlight")
+        self.flag_counts = None
+        self.chunks = OrderedDict()
+        self.saved_chunks = {}
+        self.first_click_idx = None
+        self.empty_radius = -1
+        self.mines_shown = False
+        self.mines_highlight = 0  # Given to the mines when they are shown, 2 for green
+        self.scroll = (0, 0)
+        self.view_rect = pygame.Rect(self.start_coord, (self.dims[0] * CELLSIZE, self.dims[1] * CELLSIZE))
+        self.drawn_scroll = None
+
+    def place_mines(self, mine_amount, first_click_idx, empty_radius, seed=None):
+        """ Nothing is placed yet, the chunks are made when they are needed. mine_amount is not used,
+            every cell is a mine with the chance MINE_DENSITY """
+        if seed is None:
+            seed = random.getrandbits(63)
+        self.seed = seed
+        self.first_click_idx = first_click_idx
+        self.empty_radius = empty_radius
+        # Chunks made for drawing before the first click had no seed
+        self.chunks.clear()
+        self.saved_chunks.clear()
+
+    def chunk_mines(self, chunk_row, chunk_col):
+        chunk = self.chunks.get((chunk_row, chunk_col))
+        if chunk is not None:
+            return chunk.mines
+        rng = np.random.default_rng([self.seed or 0, zigzag(chunk_row), zigzag(chunk_col)])
+        mines = rng.random((CHUNK_SIZE, CHUNK_SIZE)) < MINE_DENSITY
+        if self.first_click_idx is not None:
+            rows = np.arange(chunk_row * CHUNK_SIZE, (chunk_row + 1) * CHUNK_SIZE)[:, None]
+            cols = np.arange(chunk_col * CHUNK_SIZE, (chunk_col + 1) * CHUNK_SIZE)[None, :]
+            distance = np.abs(rows - self.first_click_idx[0]) + np.abs(cols - self.first_click_idx[1])
+            mines &= distance > self.empty_radius
+        return mines
+
+    def get_chunk(self, chunk_row, chunk_col):
+        key = (chunk_row, chunk_col)
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+            return chunk
+        chunk = self.make_chunk(chunk_row, chunk_col)
+        if key in self.saved_chunks:
+            chunk.unpack(self.saved_chunks.pop(key))
+        self.chunks[key] = chunk
+        while len(self.chunks) > CHUNK_CACHE_SIZE:
+            old_key, old_chunk = self.chunks.popitem(last=False)
+            if old_chunk.touched:
+                self.saved_chunks[old_key] = old_chunk.pack()
+        return chunk
+
+    def make_chunk(self, chunk_row, chunk_col):
+        # The numbers on the edge of a chunk count the mines of the chunks around it
+        around = np.block([[self.chunk_mines(chunk_row + i, chunk_col + j) for j in (-1, 0, 1)] for i in (-1, 0, 1)])
+        inner = slice(CHUNK_SIZE, 2 * CHUNK_SIZE)
+        mines = around[inner, inner].copy()
+        numbers = np.where(mines, -1, neighbour_count(around)[inner, inner]).astype(np.int8)
+        return Chunk(mines, numbers)
+
+    def on_board(self, row, col):
+        return True
+
+    def set_cells(self, array, rows, cols, values):
+        for row, col, value in zip(rows.tolist(), cols.tolist(), values.tolist()):
+            array[row, col] = value
+
+    def count_change(self, name, rows, cols, delta):
+        """ The infinite board can not be won and a flag can sit on a chunk edge, so the flags are counted when needed """
+        pass
+
+    def flag_count(self, row, col):
+        return sum(bool(self.flagged[i, j]) for i in range(row - 1, row + 2) for j in range(col - 1, col + 2))
+
+    def flood_reveal(self, start_idx):
+        """ Reveals outwards cell by cell, a zero region can reach into chunks that are not made yet """
+        changes = self.changes
+        queue = deque([start_idx])
+        while queue:
+            row, col = queue.popleft()
+            for i in range(row - 1, row + 2):
+                for j in range(col - 1, col + 2):
+                    if self.revealed[i, j] or self.flagged[i, j] or self.mines[i, j]:
+                        continue
+                    self.revealed[i, j] = True
+                    self.revealed_safe += 1
+                    if changes is not None:
+                        changes.append(("revealed", (i, j), False, True))
+                    if self.numbers[i, j] == 0:
+                        queue.append((i, j))
+
+    def reveal_all_mines(self):
+        """ The mines are shown when cells are drawn instead of being revealed, so chunks made later show theirs too
+            and an undo hides them all again """
+        if self.changes is not None:
+            self.changes.append(("mines_shown", None, self.mines_shown, True))
+        self.mines_shown = True
+
+    def scroll_by(self, dx, dy):
+        self.scroll = (self.scroll[0] + dx, self.scroll[1] + dy)
+
+    @profiled("get_clicked_cell")
+    def get_cell_idx(self, pos, scroll=None, zoom=1.0):
+        if not self.view_rect.collidepoint(pos):
+            return None
+        if scroll is None:
+            scroll = self.scroll
+        cell_size = CELLSIZE * zoom
+        return (int((pos[1] - self.start_coord[1] + scroll[1]) // cell_size),
+                int((pos[0] - self.start_coord[0] + scroll[0]) // cell_size))
+
+    def view_window(self):
+        """ First row and column in view and how many rows and columns can be seen,
+            one more than dims since the view can stop in the middle of a cell """
+        return self.scroll[1] // CELLSIZE, self.scroll[0] // CELLSIZE, self.shape[0] + 1, self.shape[1] + 1
+
+    def window(self, name, top, left, rows, cols):
+        """ Copies a rectangle of one of the chunk arrays into a numpy array """
+        window = None
+        for chunk_row in range(top // CHUNK_SIZE, (top + rows - 1) // CHUNK_SIZE + 1):
+            for chunk_col in range(left // CHUNK_SIZE, (left + cols - 1) // CHUNK_SIZE + 1):
+                part = getattr(self.get_chunk(chunk_row, chunk_col), name)
+                if window is None:
+                    window = np.empty((rows, cols), dtype=part.dtype)
+                row_start, row_stop = max(top, chunk_row * CHUNK_SIZE), min(top + rows, (chunk_row + 1) * CHUNK_SIZE)
+                col_start, col_stop = max(left, chunk_col * CHUNK_SIZE), min(left + cols, (chunk_col + 1) * CHUNK_SIZE)
+                window[row_start - top:row_stop - top, col_start - left:col_stop - left] = \
+                    part[row_start - chunk_row * CHUNK_SIZE:row_stop - chunk_row * CHUNK_SIZE,
+                         col_start - chunk_col * CHUNK_SIZE:col_stop - chunk_col * CHUNK_SIZE]
+        return window
+
+    def cell_looks(self):
+        top, left, rows, cols = self.view_window()
+        held_idx = None
+        if self.held_idx is not None and 0 <= self.held_idx[0] - top < rows and 0 <= self.held_idx[1] - left < cols:
+            held_idx = (self.held_idx[0] - top, self.held_idx[1] - left)
+        names = ("revealed", "flagged", "mines", "numbers", "highlight")
+        revealed, flagged, mines, numbers, highlight = [self.window(name, top, left, rows, cols) for name in names]
+        if self.mines_shown:
+            # Shown like Grid.reveal_all_mines() reveals them
+            shown = mines & ~revealed
+            revealed = revealed | shown
+            highlight = np.where(shown, self.mines_highlight, highlight)
+        return cell_looks_of(revealed, flagged, mines, numbers, highlight, held_idx=held_idx)
+
+    def draw_cell(self, screen, row, col, origin=None):
+        if self.mines_shown and self.mines[row, col] and not self.revealed[row, col]:
+            if origin is None:
+                origin = self.start_coord
+            pos = (origin[0] + col * CELLSIZE, origin[1] + row * CELLSIZE)
+            hidden_tex, revealed_tex, mine_tex, mine_red_tex, mine_green_tex, flag_tex = self.cell_textures
+            screen.blit(revealed_tex, pos)
+            screen.blit(mine_green_tex if self.mines_highlight == 2 else mine_tex, pos)
+            return
+        Grid.draw_cell(self, screen, row, col, origin)
+
+    @profiled("Grid.draw")
+    def draw(self, screen):
+        top, left, rows, cols = self.view_window()
+        origin = (self.start_coord[0] - self.scroll[0], self.start_coord[1] - self.scroll[1])
+        screen.set_clip(self.view_rect)
+        for i in range(top, top + rows):
+            for j in range(left, left + cols):
+                self.draw_cell(screen, i, j, origin)
+        screen.set_clip(None)
+
+    @profiled("Grid.update_surface")
+    def update_surface(self):
+        """ Like Grid.update_surface() for the cells in view, everything is drawn again after a scroll """
+        if self.surface is None:
+            self.surface = pygame.Surface(self.view_rect.size)
+        top, left, rows, cols = self.view_window()
+        looks = self.cell_looks()
+        scrolled = self.drawn_looks is None or self.drawn_scroll != self.scroll
+        if scrolled:
+            changed = np.argwhere(np.ones(looks.shape, dtype=bool))
+        else:
+            changed = np.argwhere(looks != self.drawn_looks)
+        self.drawn_looks = looks
+        self.drawn_scroll = self.scroll
+        for row, col in changed.tolist():
+            self.draw_cell(self.surface, top + row, left + col, (-self.scroll[0], -self.scroll[1]))
+        if scrolled or len(changed) > MAX_DIRTY_CELLS:
+            return [self.view_rect.copy()]
+        return [pygame.Rect(self.start_coord[0] + (left + col) * CELLSIZE - self.scroll[0],
+                            self.start_coord[1] + (top + row) * CELLSIZE - self.scroll[1],
+                            CELLSIZE, CELLSIZE).clip(self.view_rect) for row, col in changed.tolist()]
+
+
+# MAPPED GRID OBJECT
+class MappedGrid(InfiniteGrid):
+    """ A saved board too big to unpack, resumed straight from the mapped save file. It is an infinite grid
+        whose chunks are read from the file instead of made from the seed, so only the chunks that are seen are read,
+        and cells off the board look revealed so nothing can click or flood into them. dims is the size of the view """
+    def create_grid(self, saved=None):
+        InfiniteGrid.create_grid(self)
+        self.saved = saved
+        self.seed = saved.seed
+        self.board_shape = saved.shape
+        self.revealed_safe = saved.revealed_safe
+        self.safe_cells = saved.safe_cells
+
+    def make_chunk(self, chunk_row, chunk_col):
+        top, left = chunk_row * CHUNK_SIZE, chunk_col * CHUNK_SIZE
+        chunk = Chunk(np.zeros((CHUNK_SIZE, CHUNK_SIZE), dtype=bool), np.zeros((CHUNK_SIZE, CHUNK_SIZE), dtype=np.int8))
+        chunk.revealed[:] = True
+        on_top, on_bottom = max(top, 0), min(top + CHUNK_SIZE, self.board_shape[0])
+        on_left, on_right = max(left, 0), min(left + CHUNK_SIZE, self.board_shape[1])
+        if on_top < on_bottom and on_left < on_right:
+            part = (slice(on_top - top, on_bottom - top), slice(on_left - left, on_right - left))
+            for name in ("numbers", "mines", "revealed", "flagged"):
+                getattr(chunk, name)[part] = self.saved.window(name, on_top, on_left, on_bottom - on_top,
+                                                               on_right - on_left)
+        return chunk
+
+    def on_board(self, row, col):
+        return 0 <= row < self.board_shape[0] and 0 <= col < self.board_shape[1]
+
+    def count_change(self, name, rows, cols, delta):
+        """ Only the revealed safe cells are counted, for the win check. The flags are counted when needed """
+        if name != "revealed":
+            return
+        if not isinstance(rows, np.ndarray):
+            rows, cols, delta = [rows], [cols], [delta]
+        else:
+            rows, cols, delta = rows.tolist(), cols.tolist(), delta.tolist()
+        for row, col, change in zip(rows, cols, delta):
+            if not self.mines[row, col]:
+                self.revealed_safe += change
+
+    def reveal_all(self):
+        """ The mines are shown green, see InfiniteGrid.reveal_all_mines() """
+        if self.changes is not None:
+            self.changes.append(("mines_highlight", None, self.mines_highlight, 2))
+        self.mines_highlight = 2
+        self.reveal_all_mines()
+
+    def scroll_by(self, dx, dy):
+        """ The view stays on the board """
+        most = (self.board_shape[1] * CELLSIZE - self.view_rect.width,
+                self.board_shape[0] * CELLSIZE - self.view_rect.height)
+        self.scroll = (min(max(self.scroll[0] + dx, 0), max(most[0], 0)),
+                       min(max(self.scroll[1] + dy, 0), max(most[1], 0)))
+
+    def touched_chunks(self, top, bottom):
+        """ The chunks between rows top and bottom the player changed, in memory or packed away """
+        for (chunk_row, chunk_col), chunk in self.chunks.items():
+            if chunk.touched and top < (chunk_row + 1) * CHUNK_SIZE and chunk_row * CHUNK_SIZE < bottom:
+                yield chunk_row, chunk_col, chunk
+        for (chunk_row, chunk_col), packed in self.saved_chunks.items():
+            if top < (chunk_row + 1) * CHUNK_SIZE and chunk_row * CHUNK_SIZE < bottom:
+                chunk = Chunk(np.zeros((CHUNK_SIZE, CHUNK_SIZE), dtype=bool), None)
+                chunk.unpack(packed)
+                yield chunk_row, chunk_col, chunk
+
+    def band(self, name, top, bottom):
+        """ The rows from the file, with the chunks the player changed on top """
+        band = self.saved.window(name, top, 0, bottom - top, self.board_shape[1])
+        if name not in ("revealed", "flagged"):
+            return band
+        for chunk_row, chunk_col, chunk in self.touched_chunks(top, bottom):
+            chunk_top, chunk_left = chunk_row * CHUNK_SIZE, chunk_col * CHUNK_SIZE
+            row_start, row_stop = max(top, chunk_top), min(bottom, chunk_top + CHUNK_SIZE)
+            col_start, col_stop = max(0, chunk_left), min(self.board_shape[1], chunk_left + CHUNK_SIZE)
+            if col_start < col_stop:
+                band[row_start - top:row_stop - top, col_start:col_stop] = getattr(chunk, name)[
+                    row_start - chunk_top:row_stop - chunk_top, col_start - chunk_left:col_stop - chunk_left]
+        return band
+
+
+def load_font(size):
+    """ Uses the bundled font when there is one, looking up system fonts is slow """
+    if FONT_FILE and os.path.exists(resource_path(FONT_FILE)):
+        return pygame.font.Font(resource_path(FONT_FILE), size)
+    return pygame.font.SysFont("monospace", size, True)
+
+
+# TEXTURE ATLAS OBJECT
+class TextureAtlas(object):
+    """ Hands out textures as pieces of the atlas made by build_atlas.py, converted to the display format once.
+        Textures that are not in the atlas, or every texture if it has not been built, are loaded from their own file """
+    def __init__(self, image_path, index_path):
+        self.image_path = image_path
+        self.index = {}
+        if os.path.exists(resource_path(index_path)) and os.path.exists(resource_path(image_path)):
+            with open(resource_path(index_path), "r") as index_file:
+                self.index = json.load(index_file)
+        self.image = None
+        self.textures = {}
+
+    def get(self, path):
+        if path not in self.textures:
+            if path in self.index:
+                if self.image is None:
+                    self.image = pygame.image.load(resource_path(self.image_path)).convert_alpha()
+                self.textures[path] = self.image.subsurface(pygame.Rect(self.index[path]))
+            else:
+                self.textures[path] = pygame.image.load(resource_path(path)).convert_alpha()
+        return self.textures[path]
+
+
+# TEXT CACHE OBJECT
+class TextCache(object):
+    """ Remembers rendered text so labels are not rendered again every frame.
+        The counters are put together from digit glyphs that are only rendered once per font and color """
+    def __init__(self, max_labels=TEXT_CACHE_SIZE):
+        self.max_labels = max_labels
+        self.labels = OrderedDict()
+        self.glyphs = {}
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        label = self.labels.get(key)
+        if label is None:
+            label = font.render(text, 1, color)
+            self.labels[key] = label
+            if len(self.labels) > self.max_labels:
+                self.labels.popitem(last=False)  # Throw away the label that was used longest ago
+        else:
+            self.labels.move_to_end(key)
+        return label
+
+    def get_glyphs(self, font, color):
+        key = (font, color)
+        if key not in self.glyphs:
+            chars = "0123456789-"
+            self.glyphs[key] = {char: (font.render(char, 1, color), metrics[4])
+                                for char, metrics in zip(chars, font.metrics(chars))}
+        return self.glyphs[key]
+
+    def blit_counter(self, screen, font, number, color, pos):
+        """ Draws a number as three digits like the counters on the board """
+        glyphs = self.get_glyphs(font, color)
+        x = pos[0]
+        for char in "%03d" % number:
+            glyph, advance = glyphs[char]
+            screen.blit(glyph, (x, pos[1]))
+            x += advance
+
+
+# ASSET LOADER OBJECT
+class AssetLoader(object):
+    """ Loads the textures and fonts the board does not need on a worker thread, so the board can be shown first.
+        on_done is called from the worker thread when assets is filled in """
+    def __init__(self, atlas, on_done=None):
+        self.atlas = atlas
+        self.on_done = on_done
+        self.assets = None
+        self.error = None
+        self.seconds = None  # From start to everything loaded
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.assets = {
+                "logo": pygame.image.load(resource_path("img/interface/minesweeper_logo.png")),
+                "background_tex": pygame.image.load(resource_path("img/interface/background.png")).convert(),
+                "restart_button_list": [
+                    self.atlas.get("img/restart_button/restart_button_green.png"),
+                    self.atlas.get("img/restart_button/restart_button_yellow.png"),
+                    self.atlas.get("img/restart_button/restart_button_red.png"),
+                    self.atlas.get("img/restart_button/restart_button_green_clicked.png"),
+                    self.atlas.get("img/restart_button/restart_button_yellow_clicked.png"),
+                    self.atlas.get("img/restart_button/restart_button_red_clicked.png")
+                ],
+                "highscore_button_tex": self.atlas.get("img/interface/highscore.png"),
+                "highscore_button_clicked_tex": self.atlas.get("img/interface/highscore_clicked.png"),
+                "ui_font": load_font(50),
+                "highscore_font": load_font(30),
+                "name_font": load_font(25)
+            }
+        except Exception as error:  # Handed to the main thread by wait()
+            self.error = error
+        self.seconds = time.perf_counter() - STARTUP_TIME
+        if self.on_done:
+            self.on_done()
+
+    @property
+    def done(self):
+        return self.seconds is not None
+
+    def wait(self):
+        """ Blocks until everything is loaded and returns the assets """
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.assets
+
+
+# LEADERBOARD OBJECT
+class Leaderboard(object):
+    """ Keeps the highscores for every board setup sorted in memory. The file is read the first time it is needed
+        and written again only when a score gets on the board """
+    def __init__(self, path, size=10):
+        self.path = path
+        self.size = size
+        self.boards = None
+        self.version = 0
+
+    @staticmethod
+    def board_key(dims, mine_amount):
+        return dims[0], dims[1], mine_amount
+
+    def load(self):
+        self.boards = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as hf:
+                for line in hf:
+                    highscore_object = self.parse_highscore_line(line)
+                    if highscore_object:
+                        name, score, key = highscore_object
+                        self.boards.setdefault(key, []).append((score, name))
+        for scores in self.boards.values():
+            scores.sort(key=lambda entry: entry[0])
+            del scores[self.size:]
+        self.version += 1
+
+    def parse_highscore_line(self, line):
+        """ Lines look like 'DEV 999', scores for other board setups than the standard one end with ' 64x32:400' """
+        highscore_match = re.match(r"(\S*) ([0-9]+)(?: ([0-9]+)x([0-9]+):([0-9]+))?", line)
+        if not highscore_match:
+            return None
+        if highscore_match.group(3):
+            key = (int(highscore_match.group(3)), int(highscore_match.group(4)), int(highscore_match.group(5)))
+        else:
+            key = self.board_key(GRID_DIM, MINE_COUNT)
+        return highscore_match.group(1), int(highscore_match.group(2)), key
+
+    def top(self, dims, mine_amount, n=None):
+        """ Returns the n best (name, score) pairs for a board setup, best first """
+        if self.boards is None:
+            self.load()
+        scores = self.boards.get(self.board_key(dims, mine_amount), [])
+        return [(name, score) for score, name in scores[:n]]
+
+    def submit(self, name, new_score, dims, mine_amount):
+        """ Puts the score on the board if it is good enough and saves the file. Ties go below older scores """
+        if self.boards is None:
+            self.load()
+        scores = self.boards.setdefault(self.board_key(dims, mine_amount), [])
+        idx = bisect.bisect_right([score for score, _ in scores], new_score)
+        if idx >= self.size:
+            return False
+        scores.insert(idx, (new_score, name.upper()))
+        del scores[self.size:]
+        self.version += 1
+        self.save()
+        return True
+
+    def save(self):
+        """ Writes to a temporary file first and swaps it in, so a crash never leaves half a file behind """
+        default_key = self.board_key(GRID_DIM, MINE_COUNT)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as hf:
+            for key, scores in self.boards.items():
+                for score, name in scores:
+                    if key == default_key:
+                        hf.write("%s %d\n" % (name, score))
+                    else:
+                        hf.write("%s %d %dx%d:%d\n" % (name, score, key[0], key[1], key[2]))
+            hf.flush()
+            os.fsync(hf.fileno())
+        os.replace(tmp_path, self.path)
+
+
+# GAME OBJECT
+class Game(object):
+    """ The rules of one game with nothing drawn, so games can also be played from code.
+        GameManager puts the window and the input handling on top of this """
+    def __init__(self, dims=GRID_DIM, mine_amount=MINE_COUNT, empty_radius=EMPTY_RADIUS,
+                 cell_textures=None, number_tex_list=None, board_pool=None, seed=None, recording=False, infinite=False,
+                 journaling=False):
+        self.dims = dims
+        self.infinite = infinite
+        self.journaling = journaling
+        self.seed = seed
+        self.recording = recording
+        self.mine_amount = mine_amount
+        self.empty_radius = empty_radius
+        self.board_pool = board_pool
+        self.cell_textures = cell_textures
+        self.number_tex_list = number_tex_list
+        self.board_version = 0
+        self.new_game()
+
+    def new_game(self):
+        if self.infinite:
+            self.grid = InfiniteGrid(self.cell_textures, self.number_tex_list, self.dims)
+        else:
+            self.grid = Grid(self.cell_textures, self.number_tex_list, self.dims)
+        self.board_version += 1
+        self.is_alive = True
+        self.has_won = False
+        self.mines_placed = False
+        self.mines_flagged = 0
+        self.empty_flagged = 0
+        self.replay = Replay(self.dims, self.mine_amount, self.empty_radius) if self.recording else None
+        self.journal = Journal() if self.journaling else None
+        self.undo_used = False
+
+    def get_time_ms(self):
+        """ Time on the clock for the replay, games played from code have no clock """
+        return 0
+
+    def place_mines(self, first_click_idx):
+        """ Takes a no-guess board from the board pool if there is one, or places the mines at random """
+        mines = None
+        if self.board_pool:
+            mines = self.board_pool.take(self.dims, self.mine_amount, self.empty_radius, first_click_idx)
+        if mines is not None:
+            self.grid.mines = mines
+            self.grid.distribute_numbers()
+        else:
+            self.grid.place_mines(self.mine_amount, first_click_idx, self.empty_radius, self.seed)
+        self.mines_placed = True
+
+    def click_cell(self, cell, leftclick, double_click=False):
+        """ Clicks a cell and keeps the flag counters up to date. Returns the exit code from Cell.clicked() """
+        if not self.mines_placed:
+            self.place_mines(cell.idx)
+        if self.replay is not None:
+            self.replay.record(self.get_time_ms(), cell.idx, leftclick, double_click)
+        if self.journal is not None:
+            before = self.get_counters()
+            self.grid.changes = []
+        clicked_exit_code = cell.clicked(leftclick, double_click)
+        self.board_version += 1
+        if clicked_exit_code == 1:
+            self.mines_flagged += 1
+        elif clicked_exit_code == -1:
+            self.mines_flagged -= 1
+        elif clicked_exit_code == 4:
+            self.empty_flagged += 1
+        elif clicked_exit_code == -4:
+            self.empty_flagged -= 1
+        elif clicked_exit_code == -2:
+            self.player_dies(cell)
+        elif clicked_exit_code == -3:
+            self.player_dies(cell.exploded_mine)
+
+        if self.is_alive and self.won():
+            self.player_wins()
+        if self.journal is not None:
+            replay_event = self.replay.events[-1] if self.replay is not None else None
+            self.journal.add(JournalEntry(self.grid.changes, before, self.get_counters(), replay_event))
+            self.grid.changes = None
+        return clicked_exit_code
+
+    def get_counters(self):
+        """ The game state that is not in the grid, kept with every journal entry """
+        return {"mines_flagged": self.mines_flagged, "empty_flagged": self.empty_flagged,
+                "is_alive": self.is_alive, "has_won": self.has_won}
+
+    def set_counters(self, counters):
+        for name, value in counters.items():
+            setattr(self, name, value)
+
+    def undo(self):
+        """ Takes back the last click. Returns False if there is nothing to undo """
+        entry = self.journal.undo() if self.journal is not None else None
+        if entry is None:
+            return False
+        self.grid.apply_changes(entry, True)
+        self.set_counters(entry.before)
+        if entry.replay_event is not None:
+            self.replay.events.pop()
+        self.undo_used = True
+        self.board_version += 1
+        return True
+
+    def redo(self):
+        """ Does the last undone click again. Returns False if there is nothing to redo """
+        entry = self.journal.redo() if self.journal is not None else None
+        if entry is None:
+            return False
+        self.grid.apply_changes(entry, False)
+        self.set_counters(entry.after)
+        if entry.replay_event is not None:
+            self.replay.events.append(entry.replay_event)
+        self.board_version += 1
+        return True
+
+    def save_snapshot(self, name):
+        self.journal.save_snapshot(name)
+
+    def load_snapshot(self, name):
+        """ Undoes or redoes clicks until the game is back where the snapshot was saved.
+            Returns False if there is no such snapshot, or it was forgotten by the journal """
+        target = self.journal.snapshot_position(name) if self.journal is not None else None
+        if target is None:
+            return False
+        while self.journal.position > target:
+            self.undo()
+        while self.journal.position < target:
+            self.redo()
+        return True
+
+    def save(self, path, name=""):
+        """ Saves the game in progress, see savegame.py. Returns False if there is nothing to save """
+        if self.infinite or not self.mines_placed or not self.is_alive:
+            return False
+        tmp_path = path + ".tmp"
+        write_save(self, tmp_path, name)
+        if not isinstance(self.grid, MappedGrid):
+            os.replace(tmp_path, path)
+            return True
+        old_path = self.grid.saved.path
+        self.grid.saved = None  # A file that is mapped can not be replaced on every system
+        replaced = False
+        try:
+            os.replace(tmp_path, path)
+            replaced = True
+        finally:
+            # The new file has every change in it, so the grid reads from it from now on.
+            # If it could not be replaced, the grid goes on reading from the file it had
+            self.grid.saved = SavedGame(path if replaced else old_path)
+        return True
+
+    def use_mapped_grid(self, dims):
+        """ Saved boards this big are read from the file as they are seen instead of being unpacked """
+        return dims[0] * dims[1] > SAVE_IN_MEMORY_CELLS
+
+    def resume(self, saved):
+        """ Goes on with a game from a save file instead of making a new board """
+        self.dims = saved.dims
+        self.mine_amount = saved.mine_amount
+        self.empty_radius = saved.empty_radius
+        self.infinite = False
+        if self.use_mapped_grid(saved.dims):
+            view_dims = (min(saved.dims[0], GRID_DIM[0]), min(saved.dims[1], GRID_DIM[1]))
+            self.grid = MappedGrid(self.cell_textures, self.number_tex_list, view_dims, saved=saved)
+        else:
+            self.grid = Grid(self.cell_textures, self.number_tex_list, self.dims, saved=saved)
+        self.board_version += 1
+        self.mines_placed = True
+        self.set_counters(saved.counters())
+        self.replay = None  # Replays start at the first click
+        self.journal = Journal() if self.journaling else None
+        # A save file can be loaded again after a loss, so resumed games are kept off the highscores like undone ones
+        self.undo_used = True
+
+    def won(self):
+        """ Won when every cell without a mine is revealed, the flags do not matter.
+            The infinite board can not be won, only lost """
+        if self.infinite:
+            return False
+        return self.grid.revealed_safe == self.grid.safe_cells
+
+    def click(self, row, col, leftclick=True, double_click=False):
+        return self.click_cell(self.grid.get_cell(row, col), leftclick, double_click)
+
+    def player_dies(self, clicked_mine_cell):
+        self.is_alive = False
+        self.grid.reveal_all_mines()
+        clicked_mine_cell.highlight = True
+
+    def player_wins(self):
+        self.is_alive = False
+        self.has_won = True
+        self.grid.reveal_all()
 
 
 # GAME MANAGER
-class GameManager(object):
-    def __init__(self):
-        pygame.init()
-        logo = pygame.image.load(resource_path("img/interface/minesweeper_logo.png"))
-        pygame.display.set_icon(logo)
+class GameManager(Game):
+    def __init__(self, infinite=INFINITE_MODE):
+        # Only what the game uses, the sound and joystick subsystems are slow to start and never needed
+        pygame.display.init()
+        pygame.font.init()
         pygame.display.set_caption("Minesweeper")
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
-        self.background_tex = pygame.image.load(resource_path("img/interface/background.png"))
+        self.atlas = TextureAtlas(ATLAS_IMAGE, ATLAS_INDEX)
+        # The board is drawn as soon as the cell textures are loaded, the rest comes from the asset loader
         self.cell_textures = [
-            pygame.image.load(resource_path("img/cell/cell_hidden.png")),
-            pygame.image.load(resource_path("img/cell/cell_revealed.png")),
-            pygame.image.load(resource_path("img/cell/mine.png")),
-            pygame.image.load(resource_path("img/cell/mine_red.png")),
-            pygame.image.load(resource_path("img/cell/mine_green.png")),
-            pygame.image.load(resource_path("img/cell/flag.png"))
+            self.atlas.get("img/cell/cell_hidden.png"),
+            self.atlas.get("img/cell/cell_revealed.png"),
+            self.atlas.get("img/cell/mine.png"),
+            self.atlas.get("img/cell/mine_red.png"),
+            self.atlas.get("img/cell/mine_green.png"),
+            self.atlas.get("img/cell/flag.png")
         ]
         self.number_tex_list = [
-            pygame.image.load(resource_path("img/numbers/num_1.png")),
-            pygame.image.load(resource_path("img/numbers/num_2.png")),
-            pygame.image.load(resource_path("img/numbers/num_3.png")),
-            pygame.image.load(resource_path("img/numbers/num_4.png")),
-            pygame.image.load(resource_path("img/numbers/num_5.png")),
-            pygame.image.load(resource_path("img/numbers/num_6.png")),
-            pygame.image.load(resource_path("img/numbers/num_7.png")),
-            pygame.image.load(resource_path("img/numbers/num_8.png"))
-        ]
-        self.restart_button_list = [
-            pygame.image.load(resource_path("img/restart_button/restart_button_green.png")),
-            pygame.image.load(resource_path("img/restart_button/restart_button_yellow.png")),
-            pygame.image.load(resource_path("img/restart_button/restart_button_red.png")),
-            pygame.image.load(resource_path("img/restart_button/restart_button_green_clicked.png")),
-            pygame.image.load(resource_path("img/restart_button/restart_button_yellow_clicked.png")),
-            pygame.image.load(resource_path("img/restart_button/restart_button_red_clicked.png"))
+            self.atlas.get("img/numbers/num_1.png"),
+            self.atlas.get("img/numbers/num_2.png"),
+            self.atlas.get("img/numbers/num_3.png"),
+            self.atlas.get("img/numbers/num_4.png"),
+            self.atlas.get("img/numbers/num_5.png"),
+            self.atlas.get("img/numbers/num_6.png"),
+            self.atlas.get("img/numbers/num_7.png"),
+            self.atlas.get("img/numbers/num_8.png")
         ]
+        self.asset_loader = AssetLoader(self.atlas, on_done=lambda: pygame.event.post(pygame.event.Event(ASSETS_EVENT)))
+        self.ui_ready = False
+        self.first_frame_seconds = None
+        self.background_tex = None
+        self.restart_button_list = None
         self.restart_button_rect = pygame.Rect(RESTART_BUTTON_COORD, RESTART_BUTTON_SIZE)
         # Highscore button
-        self.highscore_button_tex = pygame.image.load(resource_path("img/interface/highscore.png"))
-        self.highscore_button_clicked_tex = pygame.image.load(resource_path("img/interface/highscore_clicked.png"))
-        self.highscore_cur_tex = self.highscore_button_tex
+        self.highscore_button_tex = None
+        self.highscore_button_clicked_tex = None
+        self.highscore_cur_tex = None
         self.highscore_button_rect = pygame.Rect(HIGHSCORE_BUTTON_COORD, HIGHSCORE_BUTTON_SIZE)
         # Highscore panel
-        self.highscore_panel_tex = pygame.image.load(resource_path("img/interface/highscore_menu.png"))
         self.highscore_panel_rect = pygame.Rect(HIGHSCORE_PANEL_COORD, HIGHSCORE_PANEL_SIZE)
         self.showing_highscores = False
         self.highscore_list = []
+        self.highscore_list_version = None
+        self.leaderboard = Leaderboard(resource_path("highscores.txt"))
         # Change name button
-        self.change_name_button_tex = pygame.image.load(resource_path("img/interface/change_name_button.png"))
-        self.change_name_button_clicked_tex = pygame.image.load(resource_path("img/interface/change_name_button_clicked.png"))
-        self.change_name_button_changing_tex = pygame.image.load(resource_path("img/interface/change_name_button_changing.png"))
-        self.change_name_cur_tex = self.change_name_button_tex
+        # The change name button textures are loaded the first time the highscore panel is opened
+        self.change_name_cur_tex = None
         self.change_name_button_rect = pygame.Rect(CHANGE_NAME_COORD, CHANGE_NAME_SIZE)
         self.changing_name = False
-        self.ui_font = pygame.font.SysFont("monospace", 50, True)
-        self.highscore_font = pygame.font.SysFont("monospace", 30, True)
-        self.name_font = pygame.font.SysFont("monospace", 25, True)
+        self.ui_font = None
+        self.highscore_font = None
+        self.name_font = None
+        self.text_cache = TextCache()
+        # For dirty rect rendering, the label rects are known once the font is loaded
+        self.last_ui_state = None
+        self.ui_rects = []
 
         self.player_name = PLAYER_NAME
+        # Set while a replay is watched, a replay that wins is never put on the leaderboard
+        self.playback = False
 
         ##################
         # This part should match restart_game()
-        self.grid = Grid(self.cell_textures, self.number_tex_list)
-        self.is_alive = True
-        self.mines_placed = False
-        self.mines_flagged = 0
-        self.empty_flagged = 0
+        board_pool = None
+        if NO_GUESS and not infinite:
+            from board_pool import BoardPool, BOARD_POOL_FOLDER
+            board_pool = BoardPool(resource_path(BOARD_POOL_FOLDER))
+        # Replays store cells as indices into a fixed board, so infinite games are not recorded
+        Game.__init__(self, GRID_DIM, MINE_COUNT, EMPTY_RADIUS, self.cell_textures, self.number_tex_list, board_pool,
+                      recording=not infinite, infinite=infinite, journaling=True)
         self.restart_button_state = 0
         self.time_elapsed = 0
         self.last_frame_time = pygame.time.get_ticks()
+        self.fill_board_pool()
         ##################
 
+        # Frame profiler overlay, see profiler.py
+        self.showing_profiler = False
+        self.profiler_font = None
+
+        # For hints, hint_mode is 0 for off, 1 for certain cells and 2 for the heatmap
+        self.hint_mode = 0
+        self.hint_version = None
+        self.hint_engine = HintEngine(on_done=lambda: pygame.event.post(pygame.event.Event(HINT_EVENT)))
+
         # For input
+        self.mouse_button_state = [False, False, False]
+        self.mouse_pos = (0, 0)
         self.left_mouse_held = False
         self.last_left_click = 0
         self.right_mouse_held = False
-        self.last_cell_held = None
+        self.hovered_idx = None
+        self.hovered_cell = None
+        self.drag_pos = None
+
+    # Textures that are seldom used are loaded the first time they are needed
+    @property
+    def highscore_panel_tex(self):
+        return self.atlas.get("img/interface/highscore_menu.png")
+
+    @property
+    def change_name_button_tex(self):
+        return self.atlas.get("img/interface/change_name_button.png")
+
+    @property
+    def change_name_button_clicked_tex(self):
+        return self.atlas.get("img/interface/change_name_button_clicked.png")
+
+    @property
+    def change_name_button_changing_tex(self):
+        return self.atlas.get("img/interface/change_name_button_changing.png")
+
+    def finish_loading(self):
+        """ Takes over what the asset loader loaded, the whole screen is drawn again next frame """
+        for name, asset in self.asset_loader.wait().items():
+            setattr(self, name, asset)
+        pygame.display.set_icon(self.logo)
+        self.highscore_cur_tex = self.highscore_button_tex
+        # Bold glyphs can reach a little outside the size the font reports, so the label rects get some slack
+        self.ui_rects = [self.restart_button_rect, self.highscore_button_rect,
+                         pygame.Rect(MINES_LEFT_LABEL_POS, self.ui_font.size("000")).inflate(20, 10),
+                         pygame.Rect(TIME_LABEL_POS, self.ui_font.size("000")).inflate(20, 10)]
+        self.ui_ready = True
+        self.last_ui_state = None
+        PROFILER.add("startup.assets", self.asset_loader.seconds)
+
+    def show_first_frame(self):
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed([pygame.QUIT, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION,
+                                  pygame.MOUSEWHEEL, pygame.KEYDOWN, pygame.VIDEOEXPOSE, CLOCK_EVENT, HINT_EVENT,
+                                  ASSETS_EVENT])
+        self.last_frame_time = pygame.time.get_ticks()
+        self.draw_game()
+        self.first_frame_seconds = time.perf_counter() - STARTUP_TIME
+        PROFILER.add("startup.first_frame", self.first_frame_seconds)
+
+    def report_startup(self):
+        """ Shows the first frame, waits for the rest of the assets and prints how long both took.
+            Returns False if the first frame took longer than STARTUP_TARGET_MS """
+        self.show_first_frame()
+        self.finish_loading()
+        self.draw_game()
+        first_frame_ms = self.first_frame_seconds * 1000
+        print("Time to first frame: %.0f ms (target %d ms)" % (first_frame_ms, STARTUP_TARGET_MS))
+        print("All assets loaded:   %.0f ms" % (self.asset_loader.seconds * 1000))
+        return first_frame_ms <= STARTUP_TARGET_MS
 
     def play_game(self):
-        running = True
-        while running:
-            if self.is_alive and self.mines_placed and not self.showing_highscores:
-                self.update_time()
+        """ Sleeps until something happens. Mouse, keyboard and the clock timer wake the loop up,
+            and all events that arrived in the meantime are handled before the next frame is drawn """
+        clock = pygame.time.Clock()
+        self.show_first_frame()
+        while True:
+            events = [pygame.event.wait()] + pygame.event.get()
+            for event in events:
+                if event.type == pygame.QUIT:
+                    return -1
+
+                if self.is_alive and self.mines_placed and not self.showing_highscores:
+                    self.update_time()
 
-            self.last_frame_time = pygame.time.get_ticks()
+                self.last_frame_time = pygame.time.get_ticks()
 
-            if len(self.player_name) == 3:
-                self.changing_name = False
+                if len(self.player_name) == 3:
+                    self.changing_name = False
 
-            if self.changing_name:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        return -1
+                if event.type == pygame.VIDEOEXPOSE:
+                    self.last_ui_state = None  # Window contents were lost, draw everything next frame
+                elif event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+                    if event.button in (1, 2, 3):
+                        self.mouse_button_state[event.button - 1] = event.type == pygame.MOUSEBUTTONDOWN
+                    self.mouse_pos = event.pos
+                elif event.type == pygame.MOUSEMOTION:
+                    self.mouse_pos = event.pos
+
+                if isinstance(self.grid, InfiniteGrid) and not self.changing_name and not self.showing_highscores:
+                    self.handle_scroll(event)
+
+                if self.changing_name:
                     if event.type == pygame.KEYDOWN:
                         if (ord('a') <= event.key <= ord('z')) or event.key in [ord('æ'), ord('ø'), ord('å')]:
                             self.player_name += chr(event.key).upper()
-            else:
-                input_exit_code = self.handle_input()
-                if input_exit_code == -1:
-                    running = False
-                elif input_exit_code == 1:
-                    self.restart_game()
+                            if len(self.player_name) == 3:
+                                self.changing_name = False
+                elif event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION):
+                    with PROFILER.phase("handle_input"):
+                        input_exit_code = self.handle_input()
+                    if input_exit_code == 1:
+                        self.restart_game()
+                elif event.type == pygame.KEYDOWN and event.key in (HINT_KEY, HEATMAP_KEY):
+                    self.toggle_hints(event.key)
+                elif event.type == pygame.KEYDOWN and event.key in (UNDO_KEY, REDO_KEY) and event.mod & pygame.KMOD_CTRL:
+                    if event.key == UNDO_KEY:
+                        self.undo()
+                    else:
+                        self.redo()
+                elif event.type == pygame.KEYDOWN and event.key in (SAVE_KEY, RESUME_KEY) and event.mod & pygame.KMOD_CTRL:
+                    if event.key == SAVE_KEY:
+                        self.save(resource_path(SAVE_FILE), self.player_name)
+                    else:
+                        self.resume_file(resource_path(SAVE_FILE))
+                elif event.type == pygame.KEYDOWN and event.key == SNAPSHOT_SAVE_KEY:
+                    self.save_snapshot("quick")
+                elif event.type == pygame.KEYDOWN and event.key == SNAPSHOT_LOAD_KEY:
+                    self.load_snapshot("quick")
+                elif event.type == HINT_EVENT:
+                    self.show_hints()
+                elif event.type == pygame.KEYDOWN and event.key == PROFILER_KEY and PROFILER.enabled:
+                    self.showing_profiler = not self.showing_profiler
+                    self.last_ui_state = None
+
+            # Checked after every wake up, the loader can be done before its event is allowed
+            if not self.ui_ready and self.asset_loader.done:
+                self.finish_loading()
+            with PROFILER.phase("frame"):
+                self.update_hints()
+                self.draw_game()
+            clock.tick(FPS_CAP)
+            self.set_clock_timer()
+
+    def handle_scroll(self, event):
+        """ Arrow keys, the mouse wheel and dragging with the middle mouse button move the infinite board """
+        if event.type == pygame.KEYDOWN and event.key in SCROLL_KEYS:
+            self.scroll_board(SCROLL_KEYS[event.key][0] * CELLSIZE, SCROLL_KEYS[event.key][1] * CELLSIZE)
+        elif event.type == pygame.MOUSEWHEEL:
+            self.scroll_board(-event.x * CELLSIZE, -event.y * CELLSIZE)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 2:
+            self.drag_pos = event.pos
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 2:
+            self.drag_pos = None
+        elif event.type == pygame.MOUSEMOTION and self.drag_pos is not None:
+            self.scroll_board(self.drag_pos[0] - event.pos[0], self.drag_pos[1] - event.pos[1])
+            self.drag_pos = event.pos
+
+    def scroll_board(self, dx, dy):
+        self.grid.scroll_by(dx, dy)
+        # Another cell is under the mouse now
+        self.hovered_idx = None
+        self.hovered_cell = None
+        self.grid.held_idx = None
+
+    def toggle_hints(self, key):
+        if isinstance(self.grid, InfiniteGrid):
+            return  # The solver needs the whole board
+        mode = 1 if key == HINT_KEY else 2
+        self.hint_mode = 0 if self.hint_mode == mode else mode
+        self.hint_version = None
+        self.show_hints()
 
-            self.draw_game()
+    def update_hints(self):
+        """ Hands the board to the hint engine after every click while hints are shown """
+        if self.hint_mode and self.is_alive and self.mines_placed and self.hint_version != self.board_version:
+            self.hint_version = self.board_version
+            self.hint_engine.submit(self.board_version, self.grid.revealed, self.grid.flagged, self.grid.numbers,
+                                    self.mine_amount)
+        elif (not self.hint_mode or not self.is_alive or not self.mines_placed) and self.grid.overlay is not None:
+            self.grid.overlay = None
+
+    def show_hints(self):
+        result = self.hint_engine.result
+        if not self.hint_mode or not self.is_alive or result is None or result[0] != self.board_version:
+            return
+        probabilities = result[1]
+        tenths = np.where(np.isnan(probabilities), 255, np.rint(np.nan_to_num(probabilities) * 10)).astype(np.uint8)
+        if self.hint_mode == 1:
+            tenths[(probabilities > 0) & (probabilities < 1)] = 255  # Only the certain cells
+        self.grid.overlay = tenths
+
+    def set_clock_timer(self):
+        """ Wakes the loop up right when the time label should show the next second """
+        if self.is_alive and self.mines_placed and not self.showing_highscores:
+            since_last_frame = pygame.time.get_ticks() - self.last_frame_time
+            pygame.time.set_timer(CLOCK_EVENT, max(1, 1000 - self.time_elapsed % 1000 - since_last_frame), 1)
+        else:
+            pygame.time.set_timer(CLOCK_EVENT, 0)
 
     def update_time(self):
         now = pygame.time.get_ticks()
         self.time_elapsed += now - self.last_frame_time
 
     def restart_game(self):
-        self.grid = Grid(self.cell_textures, self.number_tex_list)
-        self.is_alive = True
-        self.mines_placed = False
-        self.mines_flagged = 0
-        self.empty_flagged = 0
+        # After a saved game was resumed the next game is a normal one again
+        self.dims, self.mine_amount, self.empty_radius = GRID_DIM, MINE_COUNT, EMPTY_RADIUS
+        self.new_game()
+        self.hovered_idx = None
+        self.hovered_cell = None
+        self.drag_pos = None
         self.restart_button_state = 0
         self.time_elapsed = 0
         self.last_frame_time = pygame.time.get_ticks()
+        self.fill_board_pool()
 
     def handle_input(self):
-        mouse_button_state = pygame.mouse.get_pressed()
-        mouse_pos = pygame.mouse.get_pos()
+        mouse_button_state = self.mouse_button_state
+        mouse_pos = self.mouse_pos
         mouse_released = False
         if mouse_button_state[0] and not self.left_mouse_held:
             self.left_mouse_held = True
@@ -387,7 +1636,7 @@ class GameManager(object):
         mouse_over_highscore = self.highscore_button_rect.collidepoint(mouse_pos)
         if self.left_mouse_held and mouse_over_highscore:
             self.highscore_cur_tex = self.highscore_button_clicked_tex
-        if mouse_released and mouse_over_highscore:
+        if mouse_released and mouse_over_highscore and self.ui_ready:
             self.toggle_highscore_panel()
 
         if self.showing_highscores:
@@ -399,14 +1648,20 @@ class GameManager(object):
             if mouse_released and mouse_over_change_name:
                 self.change_name()
 
-        if self.last_cell_held:
-            self.last_cell_held.held = False
-        clicked_cell = self.grid.get_clicked_cell(mouse_pos)
+        # The hovered cell is only looked up again when the mouse moves onto another cell
+        hovered_idx = self.grid.get_cell_idx(mouse_pos)
+        if hovered_idx != self.hovered_idx:
+            self.hovered_idx = hovered_idx
+            self.hovered_cell = self.grid.get_cell(hovered_idx[0], hovered_idx[1]) if hovered_idx else None
+        clicked_cell = self.hovered_cell
+        held_idx = None
+        if self.left_mouse_held and clicked_cell and not clicked_cell.is_revealed:
+            held_idx = clicked_cell.idx
+        if held_idx != self.grid.held_idx:
+            self.grid.held_idx = held_idx
         if self.restart_button_state == 1:
             self.restart_button_state = 0
-        if self.left_mouse_held and clicked_cell and not clicked_cell.is_revealed:
-            clicked_cell.held = True
-            self.last_cell_held = clicked_cell
+        if held_idx:
             if self.is_alive and not clicked_cell.flagged:
                 self.restart_button_state = 1
         elif mouse_released or mouse_button_state[2]:
@@ -418,81 +1673,189 @@ class GameManager(object):
                         double_click = True
                     self.last_left_click = now
                 if not self.mines_placed:
-                    self.grid.place_mines(MINE_COUNT, clicked_cell.idx, EMPTY_RADIUS)
-                    self.mines_placed = True
+                    self.place_mines(clicked_cell.idx)
                 if (mouse_released and not clicked_cell.flagged) or (
                         mouse_button_state[2] and not self.right_mouse_held):
                     self.right_mouse_held = True
-                    clicked_exit_code = clicked_cell.clicked(mouse_released, double_click)
-                    if clicked_exit_code == 1:
-                        self.mines_flagged += 1
-                    elif clicked_exit_code == -1:
-                        self.mines_flagged -= 1
-                    elif clicked_exit_code == 4:
-                        self.empty_flagged += 1
-                    elif clicked_exit_code == -4:
-                        self.empty_flagged -= 1
-                    elif clicked_exit_code == -2:
-                        self.player_dies(clicked_cell)
-                    elif clicked_exit_code == -3:
-                        self.player_dies(clicked_cell.exploded_mine)
+                    self.click_cell(clicked_cell, mouse_released, double_click)
 
         elif not mouse_button_state[2] and self.right_mouse_held:
             self.right_mouse_held = False
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                return -1
+    def place_mines(self, first_click_idx):
+        Game.place_mines(self, first_click_idx)
+        if self.board_pool:
+            # Make a new board for the square that was just used while the player plays
+            from board_pool import region_of
+            self.fill_board_pool([region_of(first_click_idx)])
 
-        if self.mines_flagged == MINE_COUNT and self.empty_flagged == 0 and self.is_alive:
-            self.player_wins()
+    def fill_board_pool(self, first_regions=()):
+        """ Makes no-guess boards in the background, from the start and after every restart, so the first click
+            finds one ready. Until there is one for the square clicked, the board is random """
+        if self.board_pool:
+            self.board_pool.fill_in_background(self.dims, self.mine_amount, self.empty_radius, first_regions)
+
+    def get_time_ms(self):
+        return self.time_elapsed
+
+    def get_counters(self):
+        counters = Game.get_counters(self)
+        counters["time_elapsed"] = self.time_elapsed
+        return counters
+
+    def set_counters(self, counters):
+        Game.set_counters(self, counters)
+        self.restart_button_state = 0 if self.is_alive or self.has_won else 2
+        self.grid.held_idx = None
+        self.last_frame_time = pygame.time.get_ticks()
+
+    def use_mapped_grid(self, dims):
+        # The window has no scrolling for a normal board, so boards bigger than it are scrolled like infinite ones
+        return dims[0] > GRID_DIM[0] or dims[1] > GRID_DIM[1] or Game.use_mapped_grid(self, dims)
+
+    def resume_file(self, path):
+        """ Loads a saved game with its clock and player name. Returns False if there is no save file or it can not
+            be read, the game that is being played then goes on """
+        if not os.path.exists(path):
+            print("No saved game at %s" % path)
+            return False
+        try:
+            saved = SavedGame(path)
+        except (OSError, ValueError) as error:
+            print("Could not load the saved game at %s: %s" % (path, error))
+            return False
+        self.resume(saved)
+        self.player_name = saved.name or self.player_name
+        self.hovered_idx = None
+        self.hovered_cell = None
+        self.drag_pos = None
+        self.hint_mode = 0
+        self.last_ui_state = None  # The new board can be smaller than the old one
+        return True
+
+    def save_replay(self):
+        if self.replay is not None:
+            self.replay.set_board(self.grid)
+            self.replay.name = self.player_name
+            save_finished_game(self.replay, resource_path(REPLAY_FOLDER))
 
     def player_dies(self, clicked_mine_cell):
-        self.is_alive = False
-        self.grid.reveal_all_mines()
+        Game.player_dies(self, clicked_mine_cell)
         self.restart_button_state = 2
-        clicked_mine_cell.highlight = True
+        self.save_replay()
 
     def player_wins(self):
-        self.is_alive = False
-        self.grid.reveal_all()
-        self.try_save_highscore(int(self.time_elapsed / 1000), self.player_name)
+        Game.player_wins(self)
+        self.save_replay()
+        if not self.undo_used and not self.playback:
+            self.try_save_highscore(int(self.time_elapsed / 1000), self.player_name)
 
     def draw_game(self):
-        self.screen.blit(self.background_tex, (0, 0))
+        if DIRTY_RECT_RENDERING:
+            self.draw_game_dirty()
+            return
+        self.blit_background()
         self.grid.draw(self.screen)
         self.draw_ui()
-        pygame.display.flip()
+        if self.showing_profiler:
+            self.draw_profiler_overlay()
+        with PROFILER.phase("display.flip"):
+            pygame.display.flip()
+
+    def draw_game_dirty(self):
+        """ Same picture as the full redraw, but only pushes the parts of the screen that changed """
+        board_rects = self.grid.update_surface()
+        ui_state = self.get_ui_state()
+        panel_changed = self.last_ui_state is None or ui_state[0] != self.last_ui_state[0]
+        if panel_changed or (self.showing_highscores and (board_rects or ui_state != self.last_ui_state)):
+            # The highscore panel lies on top of the board, so everything is drawn again when it is involved
+            self.blit_background()
+            self.grid.blit_surface(self.screen)
+            self.draw_ui()
+            if self.showing_profiler:
+                self.draw_profiler_overlay()
+            with PROFILER.phase("display.flip"):
+                pygame.display.flip()
+        else:
+            self.grid.blit_surface(self.screen, board_rects)
+            dirty_rects = list(board_rects)
+            if ui_state != self.last_ui_state:
+                for rect in self.ui_rects:
+                    self.blit_background(rect)
+                self.draw_ui()
+                dirty_rects += self.ui_rects
+            if self.showing_profiler:
+                # The overlay lies on the board, so the board under it is put back before it is drawn again
+                self.blit_background(PROFILER_OVERLAY_RECT)
+                self.grid.blit_surface(self.screen, [PROFILER_OVERLAY_RECT.clip(self.grid.surface.get_rect(
+                    topleft=self.grid.start_coord))])
+                self.draw_profiler_overlay()
+                dirty_rects.append(PROFILER_OVERLAY_RECT)
+            if dirty_rects:
+                with PROFILER.phase("display.flip"):
+                    pygame.display.update(dirty_rects)
+        self.last_ui_state = ui_state
+
+    def blit_background(self, rect=None):
+        """ The background texture, or a plain color while it is still loading """
+        if self.background_tex is None:
+            self.screen.fill(LOADING_COLOR, rect)
+        elif rect is None:
+            self.screen.blit(self.background_tex, (0, 0))
+        else:
+            self.screen.blit(self.background_tex, rect.topleft, rect)
+
+    def draw_profiler_overlay(self):
+        if self.profiler_font is None:
+            self.profiler_font = load_font(13)
+        overlay = pygame.Surface(PROFILER_OVERLAY_RECT.size, pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 170))
+        ypos = 4
+        for line in PROFILER.lines():
+            overlay.blit(self.profiler_font.render(line, 1, (255, 255, 255)), (6, ypos))
+            ypos += self.profiler_font.get_linesize()
+        self.screen.blit(overlay, PROFILER_OVERLAY_RECT.topleft)
 
+    def get_ui_state(self):
+        """ Everything draw_ui() depends on, the panel state has to come first """
+        return (self.showing_highscores, self.restart_button_state, self.highscore_cur_tex,
+                self.mines_flagged + self.empty_flagged, min(int(self.time_elapsed / 1000), 999),
+                self.player_name, self.changing_name, self.change_name_cur_tex)
+
+    @profiled("draw_ui")
     def draw_ui(self):
+        if not self.ui_ready:
+            return
         self.screen.blit(self.restart_button_list[self.restart_button_state], self.restart_button_rect.topleft)
         self.screen.blit(self.highscore_cur_tex, self.highscore_button_rect.topleft)
         if self.showing_highscores:
             self.draw_highscore_panel()
         # Remaining mines label
-        mines_left_count = MINE_COUNT - (self.mines_flagged + self.empty_flagged)
+        mines_left_count = self.mine_amount - (self.mines_flagged + self.empty_flagged)
+        if self.infinite:
+            # No mine count, so the flags placed are shown
+            mines_left_count = min(self.mines_flagged + self.empty_flagged, 999)
         if mines_left_count < -99:
             mines_left_count = -99
-        mines_left_label = self.ui_font.render("%03d" % mines_left_count, 1, (250, 34, 28))
-        self.screen.blit(mines_left_label, MINES_LEFT_LABEL_POS)
+        self.text_cache.blit_counter(self.screen, self.ui_font, mines_left_count, (250, 34, 28), MINES_LEFT_LABEL_POS)
         # Time label
         time_in_seconds = min(int(self.time_elapsed / 1000), 999)
-        time_label = self.ui_font.render("%03d" % time_in_seconds, 1, (250, 34, 28))
-        self.screen.blit(time_label, TIME_LABEL_POS)
+        self.text_cache.blit_counter(self.screen, self.ui_font, time_in_seconds, (250, 34, 28), TIME_LABEL_POS)
 
+    @profiled("draw_highscore_panel")
     def draw_highscore_panel(self):
         self.screen.blit(self.highscore_panel_tex, self.highscore_panel_rect.topleft)
         self.load_highscores()
         text_pos = (self.highscore_panel_rect.topleft[0] + 100, self.highscore_panel_rect.topleft[1] + 20)
         ypos = text_pos[1]
         for i in range(len(self.highscore_list)):
-            highscores_label = self.highscore_font.render(self.highscore_list[i], 1, (0, 26, 65))
+            highscores_label = self.text_cache.render(self.highscore_font, self.highscore_list[i], (0, 26, 65))
             self.screen.blit(highscores_label, (text_pos[0], ypos))
             ypos += 35
-        name_label = self.name_font.render("My name is %s" % self.player_name, 1, (0, 26, 65))
+        name_label = self.text_cache.render(self.name_font, "My name is %s" % self.player_name, (0, 26, 65))
         self.screen.blit(name_label, (text_pos[0] + 40, ypos + 18))
         if not self.changing_name:
-            self.screen.blit(self.change_name_cur_tex, self.change_name_button_rect.topleft)
+            self.screen.blit(self.change_name_cur_tex or self.change_name_button_tex, self.change_name_button_rect.topleft)
         else:
             self.screen.blit(self.change_name_button_changing_tex, self.change_name_button_rect.topleft)
 
@@ -500,42 +1863,21 @@ class GameManager(object):
         self.showing_highscores = not self.showing_highscores
 
     def try_save_highscore(self, new_score, name):
-        highscores = []
-        new_highscore = False
-        with open(resource_path("highscores.txt"), "r") as hf:
-            for line in hf:
-                highscore_object = self.parse_highscore_line(line)
-                highscores.append(highscore_object)
-        for i in range(len(highscores)):
-            if highscores[i][1] > new_score:
-                highscores = highscores[:i + 1] + highscores[i:9]
-                highscores[i] = (name.upper(), new_score)
-                new_highscore = True
-                break
-        if len(highscores) < 10 and not new_highscore:
-            new_highscore = True
-            highscores.append((name.upper(), new_score))
-        with open(resource_path("highscores.txt"), "w") as hf:
-            for highscore in highscores:
-                hf.write("%s %d\n" % (highscore[0], highscore[1]))
-
-        return new_highscore
+        return self.leaderboard.submit(name, new_score, self.dims, self.mine_amount)
 
     def load_highscores(self):
+        """ Only formats the list again when the leaderboard has been written to or the board setup changed
+            since last time """
+        version = (self.leaderboard.version, self.leaderboard.board_key(self.dims, self.mine_amount))
+        if self.highscore_list_version == version:
+            return
         res = []
         count = 0
-        with open(resource_path("highscores.txt"), "r") as hf:
-            for line in hf:
-                count += 1
-                highscore_object = self.parse_highscore_line(line)
-                res.append("%02d:......%s......%03d" % (count, highscore_object[0], highscore_object[1]))
+        for name, score in self.leaderboard.top(self.dims, self.mine_amount):
+            count += 1
+            res.append("%02d:......%s......%03d" % (count, name, score))
         self.highscore_list = res
-
-    def parse_highscore_line(self, line):
-        highscore_match = re.search("([a-zA-Z]*) ([0-9]*)", line)
-        if highscore_match:
-            return (highscore_match.group(1), int(highscore_match.group(2)))
-        return None
+        self.highscore_list_version = version
 
     def change_name(self):
         self.player_name = ""
@@ -543,8 +1885,22 @@ class GameManager(object):
 
 
 def main():
-    gamemanager = GameManager()
-    gamemanager.play_game()
+    multiprocessing.freeze_support()  # Needed for the no-guess board workers in a PyInstaller build
+    if "--profile" in sys.argv[1:]:
+        PROFILER.enabled = True
+    gamemanager = GameManager(INFINITE_MODE or "--infinite" in sys.argv[1:])
+    if "--resume" in sys.argv[1:]:
+        # The save file can follow the flag, SAVE_FILE is used otherwise
+        args = sys.argv[sys.argv.index("--resume") + 1:]
+        path = args[0] if args and not args[0].startswith("--") else resource_path(SAVE_FILE)
+        gamemanager.resume_file(path)
+    if "--startup-time" in sys.argv[1:]:
+        sys.exit(0 if gamemanager.report_startup() else 1)
+    try:
+        gamemanager.play_game()
+    finally:
+        if PROFILER.enabled:
+            PROFILER.dump(os.environ.get("PYSWEEPER_PROFILE_OUT", "profile.json"))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+import functools, json, os, time
+from collections import deque
+# Times the phases of a frame and the heavy game logic while the game runs.
+# Turn it on with the environment variable PYSWEEPER_PROFILE=1 or with python minesweeper.py --profile,
+# press F3 in the game for the overlay. The timings are written to PYSWEEPER_PROFILE_OUT (profile.json) on exit
+
+# How many of the newest timings are kept for every phase
+PROFILER_WINDOW = 1000
+
+
+class Phase(object):
+    """ Times a with block and hands the time to the profiler """
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class NoPhase(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NO_PHASE = NoPhase()
+
+
+# PROFILER OBJECT
+class Profiler(object):
+    """ Keeps the newest PROFILER_WINDOW timings of every phase and gives their percentiles """
+    def __init__(self, enabled=False, window=PROFILER_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+
+    def phase(self, name):
+        if not self.enabled:
+            return NO_PHASE
+        return Phase(self, name)
+
+    def add(self, name, seconds):
+        if name not in self.samples:
+            self.samples[name] = deque(maxlen=self.window)
+            self.counts[name] = 0
+        self.samples[name].append(seconds)
+        self.counts[name] += 1
+
+    def percentiles(self, name):
+        """ Returns p50, p95, p99 and the max of the kept timings in milliseconds """
+        ordered = sorted(self.samples[name])
+        last = len(ordered) - 1
+        return tuple(ordered[int(round(last * p))] * 1000 for p in (0.5, 0.95, 0.99, 1.0))
+
+    def report(self):
+        report = {}
+        for name in sorted(self.samples):
+            p50, p95, p99, worst = self.percentiles(name)
+            report[name] = {"count": self.counts[name], "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "max_ms": worst}
+        return report
+
+    def lines(self):
+        """ The report as text lines for the overlay """
+        lines = ["%-20s %7s %7s %7s" % ("phase (ms)", "p50", "p95", "p99")]
+        for name, stats in self.report().items():
+            lines.append("%-20s %7.2f %7.2f %7.2f" % (name, stats["p50_ms"], stats["p95_ms"], stats["p99_ms"]))
+        return lines
+
+    def dump(self, path):
+        with open(path, "w") as profile_file:
+            json.dump(self.report(), profile_file, indent=2)
+
+
+PROFILER = Profiler(os.environ.get("PYSWEEPER_PROFILE", "") not in ("", "0"))
+
+
+def profiled(name):
+    """ Decorator that times every call of a function as the phase name while the profiler is on """
+    def decorate(function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                PROFILER.add(name, time.perf_counter() - start)
+        return timed
+    return decorate
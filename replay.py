@@ -0,0 +1,204 @@
+import argparse, os, struct, time
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import numpy as np
+# Replays record the seed of a game and every click, so the game can be played again exactly.
+# Play one in the window:   python replay.py replays/some_game.psr --speed 4
+# Play it without a window: python replay.py replays/some_game.psr --headless
+# Check a highscore:        python replay.py replays/some_game.psr --verify 123
+
+# Folder finished games are saved in, and how many of them are kept
+REPLAY_FOLDER = "replays"
+REPLAYS_KEPT = 50
+
+MAGIC = b"PSRP"
+VERSION = 1
+# Magic, version, columns, rows, mines, empty radius, seed, 1 if the mines are stored instead of a seed
+HEADER = struct.Struct("<4sBIIIiQB")
+
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+# REPLAY OBJECT
+class Replay(object):
+    """ The board of a game and the clicks made in it. On disk every click takes a few bytes:
+        the milliseconds since the last click and the cell index with the two click flags, both as varints """
+    def __init__(self, dims, mine_amount, empty_radius, seed=None, mines=None, name=""):
+        self.dims = dims
+        self.mine_amount = mine_amount
+        self.empty_radius = empty_radius
+        self.seed = seed
+        self.mines = mines
+        self.name = name
+        self.events = []  # (time in ms, row, col, leftclick, double_click)
+
+    def record(self, time_ms, idx, leftclick, double_click):
+        self.events.append((int(time_ms), idx[0], idx[1], bool(leftclick), bool(double_click)))
+
+    def set_board(self, grid):
+        """ Keeps the seed of the board, or the mines themselves if the board did not come from a seed """
+        self.seed = grid.seed
+        self.mines = grid.mines.copy() if grid.seed is None else None
+
+    def to_bytes(self):
+        out = bytearray(HEADER.pack(MAGIC, VERSION, self.dims[0], self.dims[1], self.mine_amount, self.empty_radius,
+                                    self.seed or 0, 1 if self.mines is not None else 0))
+        if self.mines is not None:
+            out += np.packbits(self.mines).tobytes()
+        name = self.name.encode("utf-8")
+        out.append(len(name))
+        out += name
+        last_time = 0
+        cols = self.dims[0]
+        for time_ms, row, col, leftclick, double_click in self.events:
+            write_varint(out, time_ms - last_time)
+            write_varint(out, ((row * cols + col) << 2) | (leftclick << 1) | double_click)
+            last_time = time_ms
+        return bytes(out)
+
+    @staticmethod
+    def from_bytes(data):
+        magic, version, cols, rows, mine_amount, empty_radius, seed, has_mines = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a replay file")
+        pos = HEADER.size
+        mines = None
+        if has_mines:
+            mine_bytes = (cols * rows + 7) // 8
+            bits = np.frombuffer(data, dtype=np.uint8, count=mine_bytes, offset=pos)
+            mines = np.unpackbits(bits, count=cols * rows).astype(bool).reshape(rows, cols)
+            pos += mine_bytes
+            seed = None
+        name_length = data[pos]
+        name = data[pos + 1:pos + 1 + name_length].decode("utf-8")
+        pos += 1 + name_length
+        replay = Replay((cols, rows), mine_amount, empty_radius, seed, mines, name)
+        time_ms = 0
+        while pos < len(data):
+            delta, pos = read_varint(data, pos)
+            packed, pos = read_varint(data, pos)
+            time_ms += delta
+            cell = packed >> 2
+            replay.events.append((time_ms, cell // cols, cell % cols, bool(packed & 2), bool(packed & 1)))
+        return replay
+
+    def save(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, "wb") as replay_file:
+            replay_file.write(self.to_bytes())
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as replay_file:
+            return Replay.from_bytes(replay_file.read())
+
+    def start_game(self, game):
+        """ Gets a Game (or GameManager) ready to play this replay """
+        game.seed = self.seed
+        game.new_game()
+        if self.mines is not None:
+            game.grid.mines = self.mines.copy()
+            game.grid.distribute_numbers()
+            game.mines_placed = True
+
+    def play(self, game=None):
+        """ Plays the replay without a window as fast as possible, returns the finished game """
+        from minesweeper import Game
+        if game is None:
+            game = Game(self.dims, self.mine_amount, self.empty_radius)
+        self.start_game(game)
+        for time_ms, row, col, leftclick, double_click in self.events:
+            if not game.is_alive:
+                break
+            game.click(row, col, leftclick, double_click)
+        return game
+
+    def score(self):
+        """ The highscore the game would get, the seconds on the clock at the last click """
+        if not self.events:
+            return 0
+        return int(self.events[-1][0] / 1000)
+
+    def verify(self, claimed_score):
+        """ True if playing the replay wins the game in the time that was claimed """
+        return self.play().has_won and self.score() == claimed_score
+
+
+def save_finished_game(replay, folder):
+    """ Saves a replay in the replay folder and throws away the oldest ones above REPLAYS_KEPT """
+    path = os.path.join(folder, "%s_%s_%03d.psr" % (time.strftime("%Y%m%d_%H%M%S"), replay.name or "NONAME",
+                                                   replay.score()))
+    replay.save(path)
+    replays = sorted(name for name in os.listdir(folder) if name.endswith(".psr"))
+    for name in replays[:-REPLAYS_KEPT]:
+        os.remove(os.path.join(folder, name))
+    return path
+
+
+def play_in_window(replay, speed):
+    """ Shows the replay in the game window, speed 2 plays twice as fast and speed 0 as fast as it can draw """
+    import pygame
+    from minesweeper import GameManager
+    gamemanager = GameManager()
+    gamemanager.finish_loading()
+    gamemanager.recording = False
+    gamemanager.playback = True
+    replay.start_game(gamemanager)
+    gamemanager.draw_game()
+    start = pygame.time.get_ticks()
+    for time_ms, row, col, leftclick, double_click in replay.events:
+        if speed > 0:
+            pygame.time.wait(max(0, int(time_ms / speed) - (pygame.time.get_ticks() - start)))
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return gamemanager
+        gamemanager.time_elapsed = time_ms
+        gamemanager.click(row, col, leftclick, double_click)
+        gamemanager.draw_game()
+    while not any(event.type == pygame.QUIT for event in pygame.event.get()):
+        pygame.time.wait(50)
+    return gamemanager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plays back a recorded game")
+    parser.add_argument("replay")
+    parser.add_argument("--speed", type=float, default=1.0, help="0 plays as fast as possible")
+    parser.add_argument("--headless", action="store_true", help="Play without a window and print the result")
+    parser.add_argument("--verify", type=int, metavar="SCORE", help="Check that the replay wins with this score")
+    args = parser.parse_args()
+    replay = Replay.load(args.replay)
+    if args.verify is not None:
+        valid = replay.verify(args.verify)
+        print("%s %d: %s" % (replay.name, args.verify, "valid" if valid else "NOT valid"))
+        raise SystemExit(0 if valid else 1)
+    if args.headless:
+        start = time.perf_counter()
+        game = replay.play()
+        elapsed = time.perf_counter() - start
+        print("%d clicks in %.3f ms, %s, score %d" % (len(replay.events), elapsed * 1000,
+                                                    "won" if game.has_won else "lost", replay.score()))
+    else:
+        play_in_window(replay, args.speed)
+
+
+if __name__ == "__main__":
+    main()
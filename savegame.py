@@ -0,0 +1,103 @@
+import mmap, os, struct
+import numpy as np
+# Saves a game in progress so it can be resumed later, with the clock, the flag counters and the player name.
+# The numbers are kept one byte per cell and the mines, revealed and flagged cells one bit per cell, each in a plane
+# of its own that starts on a page boundary. Resuming maps the file with mmap, so nothing is read until a part of
+# the board is looked at, and then only the pages that part lies in. Nothing has to be counted again either.
+
+# Where Ctrl+S saves the game and Ctrl+L or --resume loads it from
+SAVE_FILE = "savegame.pss"
+
+SAVE_MAGIC = b"PSSV"
+SAVE_VERSION = 1
+# Magic, version, columns, rows, mines, empty radius, 1 if there is a seed, seed, time on the clock in ms,
+# mines flagged, empty cells flagged, revealed safe cells, safe cells, player name
+SAVE_HEADER = struct.Struct("<4sBIIIiBQqiiqq16s")
+# Planes in the order they are in the file, numbers is a byte per cell and the others a bit per cell
+SAVE_PLANES = ("numbers", "mines", "revealed", "flagged")
+# Rows written at a time, so saving a huge board never needs a copy of all of it
+SAVE_BAND_ROWS = 1024
+
+
+def row_bytes(cols):
+    """ Every row of a bit plane is packed on its own, so a band of rows is one piece of the file """
+    return (cols + 7) // 8
+
+
+def plane_offsets(rows, cols):
+    """ Where each plane starts in the file, and the size of the file """
+    page = mmap.ALLOCATIONGRANULARITY
+    offsets = {}
+    end = SAVE_HEADER.size
+    for name in SAVE_PLANES:
+        end = (end + page - 1) // page * page
+        offsets[name] = end
+        end += rows * (cols if name == "numbers" else row_bytes(cols))
+    return offsets, end
+
+
+def write_save(game, path, name=""):
+    """ Writes the game to path one band of rows at a time, the grid hands out the bands with Grid.band() """
+    grid = game.grid
+    rows, cols = grid.board_shape
+    offsets, size = plane_offsets(rows, cols)
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "wb") as save_file:
+        save_file.write(SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION, cols, rows, game.mine_amount, game.empty_radius,
+                                         grid.seed is not None, grid.seed or 0, int(game.get_time_ms()),
+                                         game.mines_flagged, game.empty_flagged, grid.revealed_safe, grid.safe_cells,
+                                         name.encode("utf-8")[:16]))
+        for plane in SAVE_PLANES:
+            save_file.seek(offsets[plane])
+            for top in range(0, rows, SAVE_BAND_ROWS):
+                band = grid.band(plane, top, min(top + SAVE_BAND_ROWS, rows))
+                save_file.write((band.astype(np.int8) if plane == "numbers" else np.packbits(band, axis=1)).tobytes())
+        save_file.truncate(size)
+        save_file.flush()
+        os.fsync(save_file.fileno())
+
+
+# SAVED GAME OBJECT
+class SavedGame(object):
+    """ A save file mapped into memory. The planes are numpy arrays over the mapping, so only the pages of the cells
+        that are looked at are read from disk """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as save_file:
+            self.mmap = mmap.mmap(save_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mmap) < SAVE_HEADER.size:
+            raise ValueError("Not a save file")
+        (magic, version, cols, rows, self.mine_amount, self.empty_radius, has_seed, seed, self.time_ms,
+         self.mines_flagged, self.empty_flagged, self.revealed_safe, self.safe_cells,
+         name) = SAVE_HEADER.unpack_from(self.mmap)
+        if magic != SAVE_MAGIC or version != SAVE_VERSION:
+            raise ValueError("Not a save file")
+        offsets, size = plane_offsets(rows, cols)
+        if len(self.mmap) < size:
+            raise ValueError("The save file is cut short")
+        self.dims = (cols, rows)
+        self.shape = (rows, cols)
+        self.seed = seed if has_seed else None
+        self.name = name.rstrip(b"\0").decode("utf-8", "replace")
+        self.numbers = np.frombuffer(self.mmap, dtype=np.int8, count=rows * cols,
+                                     offset=offsets["numbers"]).reshape(rows, cols)
+        self.bits = {plane: np.frombuffer(self.mmap, dtype=np.uint8, count=rows * row_bytes(cols),
+                                          offset=offsets[plane]).reshape(rows, row_bytes(cols))
+                     for plane in SAVE_PLANES[1:]}
+
+    def window(self, plane, top, left, rows, cols):
+        """ Copies a rectangle of one plane out of the file """
+        if plane == "numbers":
+            return self.numbers[top:top + rows, left:left + cols].copy()
+        bits = self.bits[plane][top:top + rows, left // 8:row_bytes(left + cols)]
+        return np.unpackbits(bits, axis=1)[:, left % 8:left % 8 + cols].astype(bool)
+
+    def array(self, plane):
+        return self.window(plane, 0, 0, self.shape[0], self.shape[1])
+
+    def counters(self):
+        """ The counters of the game for Game.set_counters(), only games in progress are saved """
+        return {"mines_flagged": self.mines_flagged, "empty_flagged": self.empty_flagged, "is_alive": True,
+                "has_won": False, "time_elapsed": self.time_ms}
@@ -0,0 +1,233 @@
+import argparse, asyncio, itertools, json, multiprocessing, os, signal, socket, sys
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import numpy as np
+from minesweeper import Game, GRID_DIM, MINE_COUNT, EMPTY_RADIUS
+# Hosts many games at once without a window. Clients talk JSON over TCP, one message per line:
+#   {"op": "new", "dims": [32, 16], "mines": 100}                  -> {"ok": true, "session": 1, ...}
+#   {"op": "click" | "flag" | "chord", "session": 1, "row": 3, "col": 4}
+#                                                                   -> {"ok": true, "changed": [[3, 4, "2"], ...], ...}
+#   {"op": "state", "session": 1}                                   -> {"ok": true, "rows": ["##1F", ...], ...}
+#   {"op": "close", "session": 1}, {"op": "info"}
+# "new" with a session restarts that session. An "id" in a message is sent back in the answer.
+# Cells are "#" hidden, "F" flagged, "0"-"8" revealed, "*" a mine and "!" the mine that went off.
+# Start it with: python server.py --processes 4, load test it with: python loadtest.py
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+# Most sessions one connection can have open, and the biggest board a client can ask for
+MAX_SESSIONS_PER_CONNECTION = 1000
+MAX_BOARD_CELLS = 256 * 256
+# Longest message a client can send, the connection is closed above this
+MAX_MESSAGE_SIZE = 64 * 1024
+
+
+def whole_number(value, name):
+    """ int() that answers anything that is not a number, like null or Infinity, with a ValueError """
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("%s must be a whole number" % name)
+
+
+def cell_char(grid, row, col):
+    if grid.revealed[row, col]:
+        if grid.mines[row, col]:
+            return "!" if grid.highlight[row, col] == 1 else "*"
+        return str(grid.numbers[row, col])
+    return "F" if grid.flagged[row, col] else "#"
+
+
+# SESSION OBJECT
+class Session(object):
+    """ One game on the server. A click only sends back the cells it changed, found with the change list
+        the grid keeps for the undo journal """
+    def __init__(self, dims, mine_amount, empty_radius, seed=None):
+        self.game = Game(dims, mine_amount, empty_radius, seed=seed)
+
+    def play(self, row, col, leftclick, double_click):
+        game = self.game
+        grid = game.grid
+        if not game.is_alive:
+            return []
+        if not grid.on_board(row, col):
+            raise ValueError("Cell %d, %d is not on the board" % (row, col))
+        grid.changes = []
+        game.click(row, col, leftclick, double_click)
+        changed = set()
+        for _, idx, _, _ in grid.changes:
+            if isinstance(idx[0], np.ndarray):
+                changed.update(zip(idx[0].tolist(), idx[1].tolist()))
+            else:
+                changed.add(idx)
+        grid.changes = None
+        return [[row, col, cell_char(grid, row, col)] for row, col in sorted(changed)]
+
+    def rows(self):
+        grid = self.game.grid
+        view = np.where(grid.flagged, "F", "#").astype("<U1")
+        shown_numbers = grid.revealed & ~grid.mines
+        view[shown_numbers] = grid.numbers[shown_numbers].astype("<U1")
+        view[grid.revealed & grid.mines] = "*"
+        view[grid.revealed & grid.mines & (grid.highlight == 1)] = "!"
+        return ["".join(row) for row in view.tolist()]
+
+    def status(self):
+        game = self.game
+        return {"alive": game.is_alive, "won": game.has_won, "flags": game.mines_flagged + game.empty_flagged}
+
+
+SESSION_IDS = itertools.count(1)
+
+
+# GAME PROTOCOL OBJECT
+class GameProtocol(asyncio.Protocol):
+    """ One connection. All the messages that arrive in one read are answered with one write,
+        since a system call per answer costs more than the game logic """
+    def __init__(self, server):
+        self.server = server
+        self.sessions = {}
+        self.buffer = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        lines = (self.buffer + data).split(b"\n")
+        self.buffer = lines.pop()
+        if len(self.buffer) > MAX_MESSAGE_SIZE:
+            self.transport.close()
+            return
+        replies = [self.server.answer(self.sessions, line) for line in lines if line.strip()]
+        if replies:
+            self.transport.write(b"".join(replies))
+
+    # The client is not reading its answers, so stop reading its messages until it does
+    def pause_writing(self):
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.transport.resume_reading()
+
+    def connection_lost(self, exc):
+        self.server.session_count -= len(self.sessions)
+        self.sessions = {}
+
+
+# GAME SERVER OBJECT
+class GameServer(object):
+    """ Answers the messages of every connection, each connection owns the sessions it made """
+    def __init__(self, processes=1):
+        self.processes = processes
+        self.session_count = 0
+        self.moves = 0
+
+    def new_session(self, sessions, message):
+        dims = tuple(whole_number(size, "Board size") for size in message.get("dims", GRID_DIM))
+        mine_amount = whole_number(message.get("mines", MINE_COUNT), "Mine count")
+        empty_radius = whole_number(message.get("radius", EMPTY_RADIUS), "Radius")
+        seed = message.get("seed")
+        if len(dims) != 2 or min(dims) < 1 or dims[0] * dims[1] > MAX_BOARD_CELLS:
+            raise ValueError("Board size must be two sizes of at least 1 and at most %d cells" % MAX_BOARD_CELLS)
+        if not 0 <= mine_amount < dims[0] * dims[1]:
+            raise ValueError("Mine count must be from 0 to one less than the cells on the board")
+        if not 0 <= empty_radius <= dims[0] + dims[1]:
+            raise ValueError("Radius must be from 0 to the width and height of the board added up")
+        if seed is not None and (type(seed) is not int or not 0 <= seed < 2 ** 63):
+            raise ValueError("Seed must be a whole number from 0 to 2^63 - 1")
+        session_id = message.get("session")
+        if session_id is None:
+            if len(sessions) >= MAX_SESSIONS_PER_CONNECTION:
+                raise ValueError("Too many sessions on one connection")
+            session_id = next(SESSION_IDS)
+            self.session_count += 1
+        elif session_id not in sessions:
+            raise ValueError("No session %s" % session_id)
+        sessions[session_id] = Session(dims, mine_amount, empty_radius, seed)
+        return {"session": session_id, "dims": list(dims), "mines": mine_amount}
+
+    def handle_message(self, sessions, message):
+        op = message.get("op")
+        reply = {"ok": True}
+        if "id" in message:
+            reply["id"] = message["id"]
+        if op == "new":
+            reply.update(self.new_session(sessions, message))
+        elif op == "info":
+            reply.update(processes=self.processes, sessions=self.session_count, moves=self.moves, pid=os.getpid())
+        elif op in ("click", "flag", "chord", "state", "close"):
+            session = sessions.get(message.get("session"))
+            if session is None:
+                raise ValueError("No session %s" % message.get("session"))
+            if op == "state":
+                reply.update(rows=session.rows(), **session.status())
+            elif op == "close":
+                del sessions[message["session"]]
+                self.session_count -= 1
+            else:
+                reply["changed"] = session.play(whole_number(message["row"], "Row"),
+                                                whole_number(message["col"], "Column"), op != "flag", op == "chord")
+                reply.update(session.status())
+                self.moves += 1
+        else:
+            raise ValueError("Unknown op %s" % op)
+        return reply
+
+    def answer(self, sessions, line):
+        try:
+            reply = self.handle_message(sessions, json.loads(line))
+        except KeyError as error:
+            reply = {"ok": False, "error": "Missing %s" % error}
+        except (ValueError, TypeError, AttributeError, OverflowError) as error:
+            reply = {"ok": False, "error": str(error)}
+        return json.dumps(reply, separators=(",", ":")).encode() + b"\n"
+
+    async def report(self, every):
+        """ Prints the sessions held and the moves per second of this process """
+        last_moves = self.moves
+        while True:
+            await asyncio.sleep(every)
+            print("[%d] %d sessions, %.0f moves/sec" % (os.getpid(), self.session_count,
+                                                        (self.moves - last_moves) / every), flush=True)
+            last_moves = self.moves
+
+    async def serve(self, host, port, reuse_port=False, stats=0):
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(lambda: GameProtocol(self), host, port, reuse_port=reuse_port or None)
+        if stats:
+            asyncio.ensure_future(self.report(stats))
+        async with server:
+            await server.serve_forever()
+
+
+def run_server(host, port, processes, stats):
+    try:
+        asyncio.run(GameServer(processes).serve(host, port, processes > 1, stats))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hosts minesweeper games over TCP")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--processes", type=int, default=1, help="Server processes sharing the port, one per core")
+    parser.add_argument("--stats", type=float, default=0, help="Print sessions and moves/sec every this many seconds")
+    args = parser.parse_args()
+    if args.processes > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        parser.error("More than one process needs SO_REUSEPORT, which this system does not have")
+    print("Serving on %s:%d with %d process(es)" % (args.host, args.port, args.processes), flush=True)
+    workers = [multiprocessing.Process(target=run_server, args=(args.host, args.port, args.processes, args.stats))
+               for _ in range(args.processes - 1)]
+    for worker in workers:
+        worker.start()
+    # Stopping the first process stops the others too
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        run_server(args.host, args.port, args.processes, args.stats)
+    finally:
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import argparse, multiprocessing, os, random, time
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import numpy as np
+from minesweeper import Game, GRID_DIM, MINE_COUNT, EMPTY_RADIUS
+# Plays lots of games without a window, spread over a process pool, and reports how fast the game logic is.
+# Example: python simulate.py --games 2000 --dims 32x16 --mines 100 --radius 3
+
+
+def parse_dims(text):
+    cols, rows = text.lower().split("x")
+    return int(cols), int(rows)
+
+
+def next_moves(game):
+    """ Finds moves that are certain from the revealed numbers: chords on satisfied numbers and flags on cells
+        that have to be mines. Returns a list of (row, col, leftclick, double_click) """
+    grid = game.grid
+    hidden = ~grid.revealed & ~grid.flagged
+    hidden_count = grid.neighbour_count(hidden)
+    flag_count = grid.neighbour_count(grid.flagged)
+    numbered = grid.revealed & (grid.numbers > 0) & (hidden_count > 0)
+    moves = []
+    for row, col in np.argwhere(numbered & (grid.numbers == flag_count)).tolist():
+        moves.append((row, col, True, True))
+    must_be_mines = numbered & (grid.numbers - flag_count == hidden_count)
+    for row, col in np.argwhere(hidden & (grid.neighbour_count(must_be_mines) > 0)).tolist():
+        moves.append((row, col, False, False))
+    if not moves and hidden.sum() == game.mine_amount - game.mines_flagged - game.empty_flagged:
+        moves = [(row, col, False, False) for row, col in np.argwhere(hidden).tolist()]  # Only mines are left
+    return moves
+
+
+def play_game(dims, mine_amount, empty_radius, seed):
+    """ Plays one game with the auto player. Returns (won, total reveal time, reveal count, moves) """
+    random.seed(seed)
+    rng = random.Random(seed)
+    game = Game(dims, mine_amount, empty_radius)
+    reveal_time = 0.0
+    reveals = 0
+    moves = 0
+    first_click = (rng.randrange(game.grid.shape[0]), rng.randrange(game.grid.shape[1]))
+    queue = [first_click + (True, False)]
+    while game.is_alive:
+        if not queue:
+            queue = next_moves(game)
+        if not queue:
+            hidden = np.argwhere(~game.grid.revealed & ~game.grid.flagged).tolist()
+            queue = [tuple(rng.choice(hidden)) + (True, False)]  # Nothing is certain, so guess
+        row, col, leftclick, double_click = queue.pop()
+        if not leftclick and (game.grid.revealed[row, col] or game.grid.flagged[row, col]):
+            continue
+        start = time.perf_counter()
+        game.click(row, col, leftclick, double_click)
+        if leftclick:
+            reveal_time += time.perf_counter() - start
+            reveals += 1
+        moves += 1
+    return game.has_won, reveal_time, reveals, moves
+
+
+def play_game_args(args):
+    return play_game(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plays minesweeper games headless and reports throughput")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--dims", type=parse_dims, default=GRID_DIM, help="Columns x rows, like 32x16")
+    parser.add_argument("--mines", type=int, default=MINE_COUNT)
+    parser.add_argument("--radius", type=int, default=EMPTY_RADIUS, help="Radius of no mines from the first click")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    jobs = [(args.dims, args.mines, args.radius, args.seed + i) for i in range(args.games)]
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.processes) as pool:
+        results = pool.map(play_game_args, jobs, chunksize=max(1, args.games // (args.processes * 8)))
+    elapsed = time.perf_counter() - start
+
+    wins = sum(1 for result in results if result[0])
+    reveal_time = sum(result[1] for result in results)
+    reveals = sum(result[2] for result in results)
+    moves = sum(result[3] for result in results)
+    print("Board:               %dx%d, %d mines, empty radius %d" % (args.dims[0], args.dims[1], args.mines, args.radius))
+    print("Games:               %d on %d processes in %.2f s" % (args.games, args.processes, elapsed))
+    print("Games/sec:           %.1f" % (args.games / elapsed))
+    print("Moves/sec:           %.1f" % (moves / elapsed))
+    print("Mean reveal latency: %.3f ms" % (reveal_time / max(reveals, 1) * 1000))
+    print("Win rate:            %.1f %%" % (wins / args.games * 100))
+
+
+if __name__ == "__main__":
+    main()
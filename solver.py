@@ -0,0 +1,281 @@
+import math, threading, traceback
+import numpy as np
+from collections import OrderedDict
+# Works out which hidden cells are certainly safe, which are certainly mines,
+# and the chance of a mine for the rest, from the revealed numbers and the flags.
+# Flags are trusted to be right.
+
+# Components of the frontier with more undecided cells than this are not enumerated,
+# their undecided cells get the average mine density instead
+MAX_ENUMERATION_CELLS = 24
+# How many solved frontier components are remembered
+SOLVER_CACHE_SIZE = 4096
+
+
+def neighbour_count(array):
+    """ Counts the True cells in the 3x3 square around every cell at once,
+        by summing the 9 shifted views of a zero padded copy. A stack of boards is counted board by board """
+    rows, cols = array.shape[-2:]
+    padded = np.pad(array.astype(np.int8), [(0, 0)] * (array.ndim - 2) + [(1, 1), (1, 1)])
+    counts = np.zeros(array.shape, dtype=np.int8)
+    for di in range(3):
+        for dj in range(3):
+            counts += padded[..., di:di + rows, dj:dj + cols]
+    return counts
+
+
+def find_constraints(revealed, flagged, numbers):
+    """ Every revealed number next to hidden cells says how many of those cells are mines.
+        Returns a list of (tuple of flat cell indices, mines among them) """
+    rows, cols = revealed.shape
+    unknown = ~revealed & ~flagged
+    flag_count = neighbour_count(flagged)
+    frontier = revealed & (numbers >= 0) & (neighbour_count(unknown) > 0)
+    constraints = []
+    for row, col in np.argwhere(frontier).tolist():
+        cells = []
+        for i in range(max(row - 1, 0), min(row + 2, rows)):
+            for j in range(max(col - 1, 0), min(col + 2, cols)):
+                if unknown[i, j]:
+                    cells.append(i * cols + j)
+        constraints.append((tuple(cells), int(numbers[row, col]) - int(flag_count[row, col])))
+    return constraints
+
+
+def split_components(constraints):
+    """ Groups constraints that share cells, since groups that share nothing can be solved one at a time """
+    parent = {}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for cells, _ in constraints:
+        for cell in cells:
+            parent.setdefault(cell, cell)
+        for cell in cells[1:]:
+            parent[find(cell)] = find(cells[0])
+    components = {}
+    for constraint in constraints:
+        components.setdefault(find(constraint[0][0]), set()).add(constraint)
+    return [tuple(sorted(component)) for component in components.values()]
+
+
+def propagate(constraints):
+    """ Finds cells that are certain with the simple rules: a constraint with no mines left is all safe,
+        one with as many mines as cells is all mines, and a constraint inside another leaves the difference.
+        Returns ({cell: is_mine}, constraints that are still undecided) """
+    known = {}
+    constraints = [(frozenset(cells), value) for cells, value in constraints]
+    changed = True
+    while changed:
+        changed = False
+        reduced = set()
+        for cells, value in constraints:
+            value -= sum(1 for cell in cells if known.get(cell))
+            cells = frozenset(cell for cell in cells if cell not in known)
+            if not cells:
+                continue
+            if value == 0 or value == len(cells):
+                for cell in cells:
+                    known[cell] = value > 0
+                changed = True
+            else:
+                reduced.add((cells, value))
+        constraints = list(reduced)
+        if changed:
+            continue
+        for cells_a, value_a in constraints:
+            for cells_b, value_b in constraints:
+                if cells_a is cells_b or not cells_a < cells_b:
+                    continue
+                rest, rest_value = cells_b - cells_a, value_b - value_a
+                if rest_value == 0 or rest_value == len(rest):
+                    for cell in rest:
+                        known[cell] = rest_value > 0
+                    changed = True
+            if changed:
+                break
+    return known, constraints
+
+
+def enumerate_solutions(constraints):
+    """ Tries every way to place mines that fits the constraints.
+        Returns (cells, {mine count: (solutions, [solutions with a mine for each cell])}) """
+    cell_constraints = {}
+    for c_idx, (cells, _) in enumerate(constraints):
+        for cell in cells:
+            cell_constraints.setdefault(cell, []).append(c_idx)
+    # Cells are assigned in the order they are reached through the constraints, so contradictions show up early
+    order = []
+    seen = set()
+    for cells, _ in constraints:
+        for cell in sorted(cells):
+            if cell not in seen:
+                seen.add(cell)
+                order.append(cell)
+    values_left = [value for _, value in constraints]
+    cells_left = [len(cells) for cells, _ in constraints]
+    assignment = [0] * len(order)
+    results = {}
+
+    def assign(i, mines):
+        if i == len(order):
+            count, cell_counts = results.get(mines, (0, [0] * len(order)))
+            for j in range(len(order)):
+                cell_counts[j] += assignment[j]
+            results[mines] = (count + 1, cell_counts)
+            return
+        touching = cell_constraints[order[i]]
+        for is_mine in (0, 1):
+            if all(0 <= values_left[c] - is_mine <= cells_left[c] - 1 for c in touching):
+                for c in touching:
+                    values_left[c] -= is_mine
+                    cells_left[c] -= 1
+                assignment[i] = is_mine
+                assign(i + 1, mines + is_mine)
+                for c in touching:
+                    values_left[c] += is_mine
+                    cells_left[c] += 1
+        assignment[i] = 0
+
+    assign(0, 0)
+    return order, results
+
+
+class Solver(object):
+    """ Solves a board one frontier component at a time. Components are cached, so after a click only the
+        components whose numbers changed are solved again """
+    def __init__(self, cache_size=SOLVER_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def solve_component(self, component):
+        if component in self.cache:
+            self.cache.move_to_end(component)
+            return self.cache[component]
+        known, undecided = propagate(component)
+        undecided_cells = set()
+        for cells, _ in undecided:
+            undecided_cells |= cells
+        if undecided and len(undecided_cells) <= MAX_ENUMERATION_CELLS:
+            result = (known, enumerate_solutions(undecided))
+        else:
+            result = (known, None)
+        self.cache[component] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return result
+
+    def solve(self, revealed, flagged, numbers, mine_amount):
+        """ Returns an array with the chance of a mine for every hidden cell that is not flagged,
+            0 and 1 mean certain. Revealed and flagged cells are NaN """
+        unknown = ~revealed & ~flagged
+        probabilities = np.full(revealed.shape, np.nan, dtype=np.float32)
+        flat = probabilities.reshape(-1)
+        mines_left = mine_amount - int(flagged.sum())
+        # Cells that touch no number, and undecided cells of components too big to enumerate
+        other_cells = int(unknown.sum())
+
+        enumerated = []
+        for component in split_components(find_constraints(revealed, flagged, numbers)):
+            known, solutions = self.solve_component(component)
+            for cell, is_mine in known.items():
+                flat[cell] = 1.0 if is_mine else 0.0
+                mines_left -= is_mine
+                other_cells -= 1
+            if solutions is not None:
+                enumerated.append(solutions)
+                other_cells -= len(solutions[0])
+
+        # Each component spreads its solutions over mine counts, and the cells that touch no number take
+        # the mines that are left. A solution weighs as much as the ways to place those mines
+        totals = [{mines: count for mines, (count, _) in results.items()} for _, results in enumerated]
+        if not all(totals):
+            # A component no placement of mines fits, the flags do not fit the numbers
+            return probabilities
+
+        def combined(skip):
+            dist = {0: 1}
+            for c_idx, total in enumerate(totals):
+                if c_idx == skip:
+                    continue
+                new_dist = {}
+                for mines_a, count_a in dist.items():
+                    for mines_b, count_b in total.items():
+                        new_dist[mines_a + mines_b] = new_dist.get(mines_a + mines_b, 0) + count_a * count_b
+                dist = new_dist
+            return dist
+
+        def log_ways(mines):
+            if mines < 0 or mines > other_cells:
+                return None
+            return math.lgamma(other_cells + 1) - math.lgamma(mines + 1) - math.lgamma(other_cells - mines + 1)
+
+        # The ways are huge on big boards, so they are only kept relative to the largest one that is needed
+        most_frontier_mines = sum(max(total) for total in totals)
+        needed = [log_ways(mines_left - mines) for mines in range(most_frontier_mines + 1)]
+        base = max([log for log in needed if log is not None] or [0.0])
+
+        def ways(mines):
+            log = log_ways(mines)
+            if log is None:
+                return 0.0
+            return math.exp(log - base)
+
+        all_dist = combined(None)
+        weight = sum(count * ways(mines_left - mines) for mines, count in all_dist.items())
+        if weight == 0:
+            # The flags or the mine count do not fit the numbers, only the certain cells are given
+            return probabilities
+        for c_idx, (cells, results) in enumerate(enumerated):
+            rest_dist = combined(c_idx)
+            cell_weights = [0] * len(cells)
+            for mines, (_, cell_counts) in results.items():
+                rest_weight = sum(count * ways(mines_left - mines - rest) for rest, count in rest_dist.items())
+                for j in range(len(cells)):
+                    cell_weights[j] += cell_counts[j] * rest_weight
+            for j, cell in enumerate(cells):
+                flat[cell] = cell_weights[j] / weight
+        if other_cells > 0:
+            other_mines = sum(count * ways(mines_left - mines) * (mines_left - mines)
+                              for mines, count in all_dist.items())
+            probabilities[unknown & np.isnan(probabilities)] = other_mines / weight / other_cells
+        return probabilities
+
+
+class HintEngine(object):
+    """ Runs the solver in a worker thread. Only the newest board handed to submit() is solved,
+        on_done is called from the worker thread when a result is ready """
+    def __init__(self, on_done=None):
+        self.solver = Solver()
+        self.on_done = on_done
+        self.pending = None
+        self.result = None
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, key, revealed, flagged, numbers, mine_amount):
+        with self.condition:
+            self.pending = (key, revealed.copy(), flagged.copy(), numbers.copy(), mine_amount)
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                key, revealed, flagged, numbers, mine_amount = self.pending
+                self.pending = None
+            try:
+                probabilities = self.solver.solve(revealed, flagged, numbers, mine_amount)
+            except Exception:
+                # A bad board must not stop the worker, that board just gets no hints
+                traceback.print_exc()
+                probabilities = np.full(revealed.shape, np.nan, dtype=np.float32)
+            self.result = (key, probabilities)
+            if self.on_done:
+                self.on_done()
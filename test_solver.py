@@ -0,0 +1,30 @@
+import threading
+import numpy as np
+from solver import Solver, HintEngine
+
+
+def contradicting_board():
+    """ A revealed 1 with two flags next to it, so no placement of mines fits the flags """
+    revealed = np.array([[True, False], [False, False]])
+    flagged = np.array([[False, True], [True, False]])
+    numbers = np.array([[1, -1], [-1, -1]], dtype=np.int8)
+    return revealed, flagged, numbers
+
+
+def test_solve_with_flags_that_contradict_the_numbers():
+    revealed, flagged, numbers = contradicting_board()
+    probabilities = Solver().solve(revealed, flagged, numbers, 2)
+    assert probabilities.shape == (2, 2)
+    assert np.isnan(probabilities[0, 0]) and np.isnan(probabilities[0, 1]) and np.isnan(probabilities[1, 0])
+
+
+def test_hint_engine_keeps_running_after_a_contradiction():
+    solved = {1: threading.Event(), 2: threading.Event()}
+    engine = HintEngine(on_done=lambda: solved[engine.result[0]].set())
+    engine.submit(1, *contradicting_board(), 2)
+    assert solved[1].wait(5)
+    revealed = np.array([[True, False], [False, False]])
+    numbers = np.array([[0, 0], [0, 0]], dtype=np.int8)
+    engine.submit(2, revealed, np.zeros((2, 2), dtype=bool), numbers, 0)
+    assert solved[2].wait(5)
+    assert (engine.result[1][~revealed] == 0).all()